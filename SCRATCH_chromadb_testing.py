@@ -1,26 +1,24 @@
-import chromadb
-from chromadb.utils.embedding_functions import OpenAIEmbeddingFunction
+from util.embedding_store import EmbeddingStore
+from util.vector_index import EmbeddingIndex
 
-client = chromadb.PersistentClient(path="./chroma_db")
+# Offline replacement for the chromadb + OpenAI embeddings pipeline: embeddings come from the local memory-mapped
+# GloVe store (see scratchpad.py for the one-time conversion) and are searched in-process
+store = EmbeddingStore("./embeddings/common_crawl_840")
+index = EmbeddingIndex(store.get_dim())
 
-collection = client.create_collection(
-    "all-my-documents",
-    embedding_function=OpenAIEmbeddingFunction(
-        model_name="text-embedding-3-small"
-    )
+documents = ["This is document1", "This is document2"]
+index.add(
+    ids=["doc1", "doc2"],  # unique for each doc, adding an existing id replaces it
+    vectors=store.embed_texts(documents),
+    metadatas=[{"source": "notion", "text": documents[0]}, {"source": "google-docs", "text": documents[1]}],  # filter on these!
 )
 
-collection.add(
-    documents=["This is document1", "This is document2"], # we handle tokenization, embedding, and indexing automatically. You can skip that and add your own embeddings as well
-    metadatas=[{"source": "notion"}, {"source": "google-docs"}], # filter on these!
-    ids=["doc1", "doc2"], # unique for each doc
-)
-
-results = collection.query(
-    query_texts=["This is a query document"],
-    n_results=1,
+results = index.query(
+    store.embed_texts(["This is a query document"]),
+    k=1,
     # where={"metadata_field": "is_equal_to_this"}, # optional filter
-    # where_document={"$contains":"search_string"}  # optional filter
 )
 
 print(results)
+
+index.save("./embedding_index")
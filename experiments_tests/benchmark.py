@@ -0,0 +1,367 @@
+"""
+Consensus benchmark harness. Sweeps process count, choice domain size, interval count and link type over the QProc
+(PreferenceOrderEngine) and ConstrainedConsensusProc protocols and writes machine-readable JSON so runs from different
+commits can be compared. The straggler scenario gives get_choices heavy-tailed latency and compares QProc round
+latency waiting for everyone (quorum fraction 1.0) against quorum + deadline rounds.
+
+Link types: "local" runs processes on threads over in-process links, "simulated" runs them on one thread over a
+seeded lossy NetworkSimulator, where decision latencies are in virtual seconds. The straggler scenario sleeps in its
+engines and runs handlers on worker threads, so it only runs over local links.
+
+Usage (from the repository root):
+    python -m experiments_tests.benchmark --procs 3,10,30 --domains 3,30 --intervals 10,1000 --reps 20 --out bench.json
+    python -m experiments_tests.benchmark ... --compare old_bench.json
+"""
+from __future__ import annotations
+import argparse
+import contextlib
+import functools
+import io
+import itertools
+import json
+import math
+import pickle
+import platform
+import random
+import subprocess
+import time
+from threading import Thread, Lock
+from typing import Any, Callable
+
+from experiments_tests.local_util import create_fully_connected_local_procs, create_local_procs
+from router.router import LocalLink, LocalNetwork
+from router.simulated import NetworkSimulator, SimulatedLink, LatencyModel, UniformLatency
+from proc.proc import Process
+from proc.QProc import QProc, PreferenceOrderEngine, ChoiceEngine
+from proc.constrained_consensus_proc import ConstrainedConsensusProc
+
+
+class LinkStats:
+    """Message and byte counters shared by every link of one run"""
+    def __init__(self):
+        self.messages = 0
+        self.bytes = 0
+        self.__lock = Lock()
+
+    def record(self, payload: dict):
+        size = len(pickle.dumps(payload))
+        self.__lock.acquire()
+        self.messages += 1
+        self.bytes += size
+        self.__lock.release()
+
+
+class MeteredLocalLink(LocalLink):
+    """LocalLink which counts every message it sends and its pickled size"""
+    def __init__(self, stats: LinkStats):
+        super().__init__()
+        self.__stats = stats
+
+    def reliably_send(self, payload: dict):
+        self.__stats.record(payload)
+        super().reliably_send(payload)
+
+
+class MeteredLocalNetwork(LocalNetwork):
+    def __init__(self, stats: LinkStats):
+        super().__init__()
+        self.__stats = stats
+
+    def _make_link(self, pid: str, other_pid: str) -> MeteredLocalLink:
+        return MeteredLocalLink(self.__stats)
+
+
+class MeteredSimulatedLink(SimulatedLink):
+    """SimulatedLink which counts every message it sends (once, however often it is retransmitted) and its pickled size"""
+    def __init__(self, stats: LinkStats, *args):
+        super().__init__(*args)
+        self.__stats = stats
+
+    def reliably_send(self, payload: dict):
+        self.__stats.record(payload)
+        super().reliably_send(payload)
+
+
+class MeteredNetworkSimulator(NetworkSimulator):
+    def __init__(self, stats: LinkStats, **kwargs):
+        super().__init__(**kwargs)
+        self.__stats = stats
+
+    def _new_link(self, latency: LatencyModel, drop_rate: float, retransmit_timeout: float) -> SimulatedLink:
+        return MeteredSimulatedLink(self.__stats, self, latency, drop_rate, retransmit_timeout)
+
+
+# Link type name -> factory taking the run's LinkStats and a Random, returning a fresh network for one decision
+LINK_TYPES = {
+    "local": lambda stats, rng: MeteredLocalNetwork(stats),
+    "simulated": lambda stats, rng: MeteredNetworkSimulator(stats, seed=rng.getrandbits(32), latency=UniformLatency(0.001, 0.02), drop_rate=0.01),
+}
+
+
+def run_decision(network: LocalNetwork, starts: list[Callable[[], Any]], waits: list[Callable[[], Any]]) -> float:
+    """
+    Call every start concurrently, then every wait, returning the decision latency. Local networks run each start on
+    its own thread and measure wall time, simulators schedule the starts at the current virtual time and measure
+    virtual time
+    """
+    if isinstance(network, NetworkSimulator):
+        with network:
+            begin = network.now()
+            for start in starts:
+                network.schedule(0, start)
+            network.run()
+            for wait in waits:
+                wait()
+            return network.now() - begin
+
+    threads = [Thread(target=start) for start in starts]
+    begin = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    for wait in waits:
+        wait()
+    return time.perf_counter() - begin
+
+
+def percentile(values: list[float], p: float) -> float:
+    """Nearest-rank percentile, p in [0, 100]"""
+    srt = sorted(values)
+    return srt[max(math.ceil(p / 100 * len(srt)) - 1, 0)]
+
+
+def summarize(scenario: str, params: dict, wall_time: float, latencies: list[float], rounds: list[int] | None, stats: LinkStats) -> dict:
+    """rounds is None for protocols without rounds, leaving the round metrics out"""
+    decisions = len(latencies)
+    result = {
+        "scenario": scenario,
+        "params": params,
+        "decisions": decisions,
+        "wall_time_s": wall_time,
+        "messages_per_decision": stats.messages / decisions,
+        "bytes_per_decision": stats.bytes / decisions,
+        "latency_p50_s": percentile(latencies, 50),
+        "latency_p99_s": percentile(latencies, 99),
+    }
+    if rounds is not None:
+        result["rounds_mean"] = sum(rounds) / decisions
+        result["rounds_max"] = max(rounds)
+    return result
+
+
+def bench_qproc(n_procs: int, domain_size: int, link_type: str, reps: int, rng: random.Random) -> dict:
+    """One decision per repetition, each process starts with a uniformly random preference order over the domain"""
+    stats = LinkStats()
+    domain = [f"c{i}" for i in range(domain_size)]
+    pids = [str(i) for i in range(n_procs)]
+    latencies, rounds = [], []
+
+    wall_start = time.perf_counter()
+    for _ in range(reps):
+        engines = []
+        for pid in pids:
+            pref_order = list(domain)
+            rng.shuffle(pref_order)
+            engines.append(PreferenceOrderEngine(frozenset(domain), pref_order, pid))
+        network = LINK_TYPES[link_type](stats, rng)
+        procs = create_local_procs(QProc, pids, [{"leader_pid": pids[0], "choice_engine": e} for e in engines], network=network)
+
+        latencies.append(run_decision(network, [procs[pids[0]].start], [proc.await_final_choices for proc in procs.values()]))
+        rounds.append(procs[pids[0]].get_rounds())
+    wall_time = time.perf_counter() - wall_start
+
+    return summarize("qproc", {"procs": n_procs, "domain": domain_size, "link": link_type}, wall_time, latencies, rounds, stats)
+
+
+def bench_constrained(n_procs: int, n_intervals: int, link_type: str, reps: int, rng: random.Random) -> dict:
+    """One decision per repetition, each process blocks n_intervals random 1-3 hour intervals over the next week"""
+    stats = LinkStats()
+    pids = [str(i) for i in range(n_procs)]
+    latencies = []
+
+    wall_start = time.perf_counter()
+    for _ in range(reps):
+        network = LINK_TYPES[link_type](stats, rng)
+        procs = create_local_procs(ConstrainedConsensusProc, pids, [{"pids": pids, "leader_pid": pids[0]}] * n_procs, network=network)
+        now = time.time()
+        constraints = dict()
+        for pid in pids:
+            constraints[pid] = []
+            for _ in range(n_intervals):
+                s = now + rng.uniform(0, 7 * 24 * 60 * 60)
+                constraints[pid].append((s, s + rng.uniform(1, 3) * 60 * 60))
+
+        latencies.append(run_decision(network, [functools.partial(procs[pid].agree_on_value, constraints[pid]) for pid in pids], []))
+    wall_time = time.perf_counter() - wall_start
+
+    return summarize("constrained", {"procs": n_procs, "intervals": n_intervals, "link": link_type}, wall_time, latencies, None, stats)
+
+
+class DelayedChoiceEngine(ChoiceEngine):
+    """Wraps an engine so get_choices takes a log-normally distributed time, like an LLM-backed engine would"""
+    def __init__(self, engine: ChoiceEngine, rng: random.Random, median: float, sigma: float):
+        self.__engine = engine
+        self.__rng = rng
+        self.__mu = math.log(median)
+        self.__sigma = sigma
+
+    def get_choices(self):
+        time.sleep(self.__rng.lognormvariate(self.__mu, self.__sigma))
+        return self.__engine.get_choices()
+
+    def add_context(self, src_pid, context, choices):
+        self.__engine.add_context(src_pid, context, choices)
+
+    def get_context_version(self):
+        return self.__engine.get_context_version()
+
+    def compute_intersection(self, choice_sets):
+        return self.__engine.compute_intersection(choice_sets)
+
+    def largest_intersecting_subsets(self, choice_sets):
+        return self.__engine.largest_intersecting_subsets(choice_sets)
+
+    def is_choice_set_empty(self, choices):
+        return self.__engine.is_choice_set_empty(choices)
+
+    def is_subset(self, choices, of_choices):
+        return self.__engine.is_subset(choices, of_choices)
+
+
+def bench_straggler(n_procs: int, quorum_fraction: float, link_type: str, reps: int, rng: random.Random,
+                    median: float = 0.005, sigma: float = 1.0, round_deadline: float = 0.01, domain_size: int = 5) -> dict:
+    """
+    Like bench_qproc, but get_choices latency is log-normal and routers run handlers on worker threads. A quorum
+    fraction below 1 enables quorum + deadline rounds with quorum ceil(fraction * procs). Local links only
+    """
+    stats = LinkStats()
+    domain = [f"c{i}" for i in range(domain_size)]
+    pids = [str(i) for i in range(n_procs)]
+    quorum = math.ceil(quorum_fraction * n_procs) if quorum_fraction < 1 else None
+    latencies, rounds, round_latencies = [], [], []
+
+    wall_start = time.perf_counter()
+    for _ in range(reps):
+        engines = []
+        for pid in pids:
+            pref_order = list(domain)
+            rng.shuffle(pref_order)
+            engines.append(DelayedChoiceEngine(PreferenceOrderEngine(frozenset(domain), pref_order, pid), rng, median, sigma))
+        procs = create_fully_connected_local_procs(QProc, pids, [{"leader_pid": pids[0], "choice_engine": e, "quorum": quorum,
+                                                                  "round_deadline": round_deadline} for e in engines],
+                                                   functools.partial(MeteredLocalLink, stats), {"workers": 4})
+
+        start = time.perf_counter()
+        procs[pids[0]].start()
+        for proc in procs.values():
+            proc.await_final_choices()
+        latencies.append(time.perf_counter() - start)
+        rounds.append(procs[pids[0]].get_rounds())
+        round_latencies += procs[pids[0]].get_round_latencies()
+
+        for proc in procs.values():
+            proc.get_router().shutdown()
+    wall_time = time.perf_counter() - wall_start
+
+    result = summarize("straggler", {"procs": n_procs, "quorum_fraction": quorum_fraction, "link": link_type,
+                                     "median_s": median, "sigma": sigma, "round_deadline_s": round_deadline},
+                       wall_time, latencies, rounds, stats)
+    result["round_latency_p50_s"] = percentile(round_latencies, 50)
+    result["round_latency_p99_s"] = percentile(round_latencies, 99)
+    return result
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_sweep(scenarios: list[str], procs: list[int], domains: list[int], intervals: list[int], links: list[str], reps: int, seed: int,
+              quorums: list[float] = (1.0,)) -> dict:
+    rng = random.Random(seed)
+    results = []
+
+    Process.VERBOSE = False
+    for scenario in scenarios:
+        if scenario == "qproc":
+            grid = [(bench_qproc, n, d, link) for n, d, link in itertools.product(procs, domains, links)]
+        elif scenario == "constrained":
+            grid = [(bench_constrained, n, k, link) for n, k, link in itertools.product(procs, intervals, links)]
+        elif scenario == "straggler":
+            # Sleeping engines and worker threads can't run on the single threaded simulator
+            grid = [(bench_straggler, n, q, link) for n, q, link in itertools.product(procs, quorums, links) if link == "local"]
+        else:
+            raise ValueError(f"Unknown scenario {scenario}")
+
+        for bench, n, size, link in grid:
+            # Engines print their internal state on every call, keep that out of the benchmark output
+            with contextlib.redirect_stdout(io.StringIO()):
+                result = bench(n, size, link, reps, rng)
+            print(f"{result['scenario']} {result['params']}: wall {result['wall_time_s']:.3f}s, "
+                  + (f"rounds {result['rounds_mean']:.2f}, " if "rounds_mean" in result else "")
+                  + f"msgs/dec {result['messages_per_decision']:.1f}, "
+                  f"bytes/dec {result['bytes_per_decision']:.0f}, p50 {result['latency_p50_s'] * 1000:.2f}ms, "
+                  f"p99 {result['latency_p99_s'] * 1000:.2f}ms"
+                  + (f", round p50 {result['round_latency_p50_s'] * 1000:.2f}ms, round p99 {result['round_latency_p99_s'] * 1000:.2f}ms"
+                     if "round_latency_p50_s" in result else ""))
+            results.append(result)
+
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": time.time(),
+            "seed": seed,
+            "reps": reps,
+        },
+        "results": results,
+    }
+
+
+def compare(old: dict, new: dict, metrics: tuple[str, ...] = ("wall_time_s", "messages_per_decision", "bytes_per_decision", "latency_p50_s", "latency_p99_s")):
+    """Print new / old ratios of each metric for every configuration present in both result files"""
+    def key(r: dict):
+        return r["scenario"], tuple(sorted(r["params"].items()))
+
+    old_by_key = {key(r): r for r in old["results"]}
+    print(f"Comparing {old['meta'].get('commit')} -> {new['meta'].get('commit')}")
+    for r in new["results"]:
+        if key(r) not in old_by_key:
+            continue
+        o = old_by_key[key(r)]
+        ratios = ", ".join(f"{m} x{r[m] / o[m]:.2f}" if o[m] else f"{m} n/a" for m in metrics)
+        print(f"{r['scenario']} {r['params']}: {ratios}")
+
+
+def _int_list(s: str) -> list[int]:
+    return [int(x) for x in s.split(",")]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sweep consensus protocols and write JSON results")
+    parser.add_argument("--scenarios", default="qproc,constrained,straggler")
+    parser.add_argument("--procs", type=_int_list, default=[3, 10, 30])
+    parser.add_argument("--domains", type=_int_list, default=[3, 30])
+    parser.add_argument("--intervals", type=_int_list, default=[10, 1000])
+    parser.add_argument("--links", default=",".join(LINK_TYPES))
+    parser.add_argument("--quorums", type=lambda s: [float(x) for x in s.split(",")], default=[1.0, 0.75],
+                        help="Quorum fractions for the straggler scenario, 1.0 waits for everyone")
+    parser.add_argument("--reps", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="bench_results.json")
+    parser.add_argument("--compare", default=None, help="Previous results file to print ratios against")
+    args = parser.parse_args()
+
+    output = run_sweep(args.scenarios.split(","), args.procs, args.domains, args.intervals, args.links.split(","), args.reps, args.seed,
+                       args.quorums)
+    with open(args.out, "w") as f:
+        json.dump(output, f, indent=2)
+    print(f"Wrote {len(output['results'])} results to {args.out}")
+
+    if args.compare is not None:
+        with open(args.compare, "r") as f:
+            compare(json.load(f), output)
@@ -0,0 +1,83 @@
+"""
+Decision log throughput benchmark. Concurrent committers append decision-sized records to a DecisionLog under each
+durability setting, reporting commits/sec, fsyncs and p50/p99 commit latency, then time recovery of the written log.
+
+Usage (from the repository root):
+    python -m experiments_tests.decision_log_bench --threads 1,8,64 --commits 2000 --out log_bench.json
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import tempfile
+import time
+from threading import Thread
+
+from experiments_tests.benchmark import percentile
+from util.decision_log import DecisionLog
+
+# None: flush to OS only, 0: fsync every commit, > 0: group commit window in seconds
+DURABILITY_WINDOWS = [None, 0, 0.0005, 0.002, 0.01]
+
+
+def bench_log(durability_window: float | None, n_threads: int, n_commits: int, directory: str) -> dict:
+    path = os.path.join(directory, f"decisions_{durability_window}_{n_threads}.log")
+    log = DecisionLog(path, durability_window)
+    per_thread = n_commits // n_threads
+    latencies: list[list[float]] = [[] for _ in range(n_threads)]
+
+    def committer(t: int):
+        for i in range(per_thread):
+            start = time.perf_counter()
+            log.append({"decision_id": str(i), "pid": str(t), "choices": frozenset([f"choice_{i % 7}", f"choice_{i % 5}"])})
+            latencies[t].append(time.perf_counter() - start)
+
+    threads = [Thread(target=committer, args=[t]) for t in range(n_threads)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    stats = log.get_stats()
+    log.close()
+
+    start = time.perf_counter()
+    recovered = len(DecisionLog(path, None).get_recovered())
+    recovery_time = time.perf_counter() - start
+
+    all_latencies = [x for lat in latencies for x in lat]
+    return {
+        "durability_window_s": durability_window,
+        "threads": n_threads,
+        "commits": stats["appended"],
+        "fsyncs": stats["fsyncs"],
+        "commits_per_s": stats["appended"] / elapsed,
+        "latency_p50_s": percentile(all_latencies, 50),
+        "latency_p99_s": percentile(all_latencies, 99),
+        "recovered": recovered,
+        "recovery_s": recovery_time,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure decision log commits/sec against durability settings")
+    parser.add_argument("--threads", type=lambda s: [int(x) for x in s.split(",")], default=[1, 8, 64])
+    parser.add_argument("--commits", type=int, default=2000)
+    parser.add_argument("--dir", default=None, help="Directory to write logs in (defaults to a temporary one)")
+    parser.add_argument("--out", default=None, help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory(dir=args.dir) as directory:
+        for window in DURABILITY_WINDOWS:
+            for n_threads in args.threads:
+                r = bench_log(window, n_threads, args.commits, directory)
+                print(f"window {window}, {n_threads} threads: {r['commits_per_s']:.0f} commits/s, {r['fsyncs']} fsyncs, "
+                      f"p50 {r['latency_p50_s'] * 1000:.2f}ms, p99 {r['latency_p99_s'] * 1000:.2f}ms, "
+                      f"recovered {r['recovered']} in {r['recovery_s'] * 1000:.1f}ms")
+                results.append(r)
+
+    if args.out is not None:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,74 @@
+"""
+Import-time regression benchmark. Imports each target module in a fresh interpreter with `-X importtime`, takes the
+best cumulative import time over a few runs and fails if it exceeds its budget or if any heavy optional backend
+(LLM clients, SDL, numpy, ...) got imported along with it.
+
+Usage (from the repository root):
+    python -m experiments_tests.import_time_bench
+    python -m experiments_tests.import_time_bench --json import_times.json
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Target module -> (cumulative import time budget in ms, modules that must not be imported as a side effect)
+BUDGETS = {
+    "router.router": (20, ["numpy", "pygame", "ollama"]),
+    "router.simulated": (20, ["numpy", "pygame", "ollama"]),
+    "proc.QProc": (50, ["numpy", "pygame", "ollama", "util.vector_index"]),
+    "proc.constrained_consensus_proc": (50, ["numpy", "pygame", "ollama"]),
+    "experiments_tests.local_tests": (100, ["numpy", "pygame", "ollama"]),
+    "experiments_tests.benchmark": (120, ["numpy", "pygame", "ollama"]),
+}
+
+
+def measure_import(module: str) -> tuple[float, set[str]]:
+    """Cumulative import time of module in ms and the set of every module imported with it, from one fresh interpreter"""
+    res = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=REPO_ROOT,
+                         capture_output=True, text=True, check=True)
+    cumulative_us = None
+    imported = set()
+    # Lines look like "import time:       524 |       2534 | router.simulated", nested imports are indented
+    for line in res.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        name = name.strip()
+        imported.add(name)
+        if name == module:
+            cumulative_us = int(cumulative)
+    return cumulative_us / 1000, imported
+
+
+def run(repeats: int) -> tuple[dict, bool]:
+    results = dict()
+    ok = True
+    for module, (budget_ms, forbidden) in BUDGETS.items():
+        runs = [measure_import(module) for _ in range(repeats)]
+        best_ms = min(r[0] for r in runs)
+        leaked = sorted(f for f in forbidden if f in runs[0][1])
+        passed = best_ms <= budget_ms and not len(leaked)
+        ok = ok and passed
+
+        results[module] = {"import_ms": best_ms, "budget_ms": budget_ms, "forbidden_imported": leaked, "passed": passed}
+        print(f"{'PASS' if passed else 'FAIL'} {module}: {best_ms:.1f}ms (budget {budget_ms}ms)"
+              + (f", imported {', '.join(leaked)}" if len(leaked) else ""))
+    return results, ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check import times against budgets")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--json", default=None, help="Write results to this file")
+    args = parser.parse_args()
+
+    results, ok = run(args.repeats)
+    if args.json is not None:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    sys.exit(0 if ok else 1)
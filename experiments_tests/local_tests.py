@@ -1,14 +1,16 @@
 import math
 
-from experiments_tests.local_util import create_fully_connected_local_procs
+from experiments_tests.local_util import create_fully_connected_local_procs, create_local_procs
 from router.router import Router, LocalLink
+from router.simulated import NetworkSimulator, UniformLatency
+from router.topology import StarTopology
+from proc.proc import Process
 from proc.hello_proc import HelloProcess
 from proc.constrained_consensus_proc import ConstrainedConsensusProc
-from proc.QProc import QProc, DiscreteLLMContextEngine, PreferenceOrderEngine
+from proc.QProc import QProc, PreferenceOrderEngine
 from datetime import datetime, timedelta, timezone
 from zoneinfo import ZoneInfo
 from threading import Thread, Lock, Condition
-from visualization.interval_visualizer import IntervalVisualizer
 from util.util import do_intervals_intersect
 import time
 import random
@@ -29,6 +31,9 @@ def hello_test():
 
 
 def constrained_test():
+    # Imported here so the other tests don't pay for loading pygame
+    from visualization.interval_visualizer import IntervalVisualizer
+
     PIDS = ["0", "1", "2"]
     PROCS: dict[str, ConstrainedConsensusProc] = create_fully_connected_local_procs(ConstrainedConsensusProc, PIDS, [{"pids": PIDS, "leader_pid": "0"}] * len(PIDS))
 
@@ -124,5 +129,33 @@ def qproc_engine_test():
         proc.start()
 
 
+def simulated_qproc_test(n: int = 200, seed: int = 0):
+    """
+    Run one QProc decision among n processes on a star around the leader, over a simulated lossy network with virtual
+    time. Everything runs on this thread and the same seed reproduces the same run
+    """
+    rng = random.Random(seed)
+    choices = frozenset([f"choice_{i}" for i in range(5)])
+    pids = [str(i) for i in range(n)]
+    engines = []
+    for pid in pids:
+        pref_order = sorted(choices)
+        rng.shuffle(pref_order)
+        engines.append(PreferenceOrderEngine(choices, pref_order, pid))
+
+    Process.VERBOSE = False
+    sim = NetworkSimulator(seed=seed, latency=UniformLatency(0.001, 0.02), drop_rate=0.01)
+    start = time.perf_counter()
+    with sim:
+        PROCS = create_local_procs(QProc, pids, [{"leader_pid": "0", "choice_engine": e} for e in engines], StarTopology(pids, "0"), sim)
+        PROCS["0"].start()
+        sim.run()
+    outputs = {PROCS[pid].await_final_choices() for pid in pids}
+
+    assert len(outputs) == 1
+    print(f"Committed {outputs} after {PROCS['0'].get_rounds()} rounds, {sim.get_stats()}, "
+          f"real time {time.perf_counter() - start:.2f}s")
+
+
 if __name__ == "__main__":
     qproc_engine_test()
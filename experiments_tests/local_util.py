@@ -1,11 +1,14 @@
-from router.router import Router, LocalLink
+from router.router import Router, LocalLink, LocalNetwork
+from router.topology import Topology, FullMeshTopology
 from proc.proc import Process
 
 
-def create_fully_connected_local_procs(proc_class, pids: list[str], additional_params: list[dict] = None) -> dict[str, Process]:
+def create_fully_connected_local_procs(proc_class, pids: list[str], additional_params: list[dict] = None, link_class=LocalLink,
+                                       router_params: dict | None = None) -> dict[str, Process]:
     """
     Generate processes fully connected by local links given the process class, pids, and parameters. Takes care of
-    creating the routers, links, and link connections
+    creating the routers, links, and link connections. link_class is called with no arguments to make
+    each LocalLink (e.g. an instrumented subclass). router_params are passed to every Router (e.g. workers, queue_size)
     """
 
     if additional_params is None:
@@ -19,9 +22,9 @@ def create_fully_connected_local_procs(proc_class, pids: list[str], additional_p
     for i in range(len(pids)):
         pid = pids[i]
         params = additional_params[i]
-        router = Router()
+        router = Router(pid, **(router_params or dict()))
         for target_pid in pids:
-            router.register_link(target_pid, LocalLink())
+            router.register_link(target_pid, link_class())
         procs[pid] = proc_class(pid, router, **params)
 
     # Link each process' links to corresponding other local link
@@ -32,3 +35,31 @@ def create_fully_connected_local_procs(proc_class, pids: list[str], additional_p
             local_link.set_target_link(procs[target_pid].get_router().get_links()[proc.get_pid()])
 
     return procs
+
+
+def create_local_procs(proc_class, pids: list[str], additional_params: list[dict] = None, topology: Topology | None = None,
+                       network: LocalNetwork | None = None, router_params: dict | None = None) -> dict[str, Process]:
+    """
+    Generate processes connected by local links over the given topology (full mesh by default). Links are only created
+    between neighbors once they first exchange a message, and messages to non-neighbors are forwarded by the routers.
+    Pass a network (e.g. a router.simulated.NetworkSimulator) to control which links are created, router_params are
+    passed to every Router
+    """
+
+    if additional_params is None:
+        additional_params = [dict() for _ in pids]
+    if topology is None:
+        topology = FullMeshTopology(pids)
+
+    assert len(pids) == len(additional_params)
+
+    if network is None:
+        network = LocalNetwork()
+
+    procs = {}
+    for i in range(len(pids)):
+        router = Router(pids[i], topology, network.connect, **(router_params or dict()))
+        network.add_router(pids[i], router)
+        procs[pids[i]] = proc_class(pids[i], router, **additional_params[i])
+
+    return procs
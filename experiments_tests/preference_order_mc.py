@@ -0,0 +1,127 @@
+"""
+Vectorized Monte-Carlo simulation of QProc rounds with PreferenceOrderEngine. Runs the same decision logic as the
+threaded implementation (rank summing over known preference orders, argmin ties, intersection at the leader, full
+perception exchange on an empty intersection, empty commit after MAX_ROUNDS) for a whole batch of random preference
+profiles at once with NumPy, without routers or threads.
+
+Usage (from the repository root):
+    python -m experiments_tests.preference_order_mc --batch 10000 --procs 3,10,50 --domains 3,10 --verify 20
+"""
+from __future__ import annotations
+import argparse
+import contextlib
+import io
+import json
+import numpy as np
+
+MAX_ROUNDS = 5
+CHUNK = 1024
+
+
+def random_profiles(rng: np.random.Generator, batch: int, n_procs: int, domain_size: int) -> np.ndarray:
+    """batch x n_procs x domain_size uniformly random preference orders, entry [b, i, k] is proc i's k-th best choice"""
+    return np.argsort(rng.random((batch, n_procs, domain_size)), axis=2)
+
+
+def simulate(orders: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Simulate one decision per profile. Returns the round each profile committed in and a batch x domain_size boolean
+    mask of the committed choice set (all False for an empty commit)
+    """
+    batch, n_procs, domain_size = orders.shape
+    rounds = np.zeros(batch, dtype=np.int64)
+    committed = np.zeros((batch, domain_size), dtype=bool)
+
+    for lo in range(0, batch, CHUNK):
+        chunk = orders[lo:lo + CHUNK]
+        b = len(chunk)
+        # ranks[b, i, c] is the index of choice c in proc i's preference order
+        ranks = np.argsort(chunk, axis=2).astype(np.int64)
+        # known[b, i, j]: proc i has proc j's preference order as context. Everyone starts knowing only their own
+        known = np.broadcast_to(np.eye(n_procs, dtype=np.int64), (b, n_procs, n_procs)).copy()
+        undecided = np.ones(b, dtype=bool)
+
+        for rnd in range(1, MAX_ROUNDS + 1):
+            # Each proc's choices: the choices with the lowest summed rank over the orders it knows
+            sums = known @ ranks
+            choices = sums == sums.min(axis=2, keepdims=True)
+            intersection = choices.all(axis=1)
+
+            commit = undecided & (intersection.any(axis=1) | (rnd >= MAX_ROUNDS))
+            rounds[lo:lo + b][commit] = rnd
+            committed[lo:lo + b][commit] = intersection[commit]
+            undecided &= ~commit
+            if not undecided.any():
+                break
+
+            # Perception exchange, every proc shares its own order with every other proc
+            known[undecided] = 1
+
+    return rounds, committed
+
+
+def summarize(rounds: np.ndarray, committed: np.ndarray) -> dict:
+    sizes = committed.sum(axis=1)
+    values, counts = np.unique(rounds, return_counts=True)
+    return {
+        "profiles": len(rounds),
+        "rounds_histogram": {int(v): int(c) for v, c in zip(values, counts)},
+        "rounds_mean": float(rounds.mean()),
+        "empty_commits": int((sizes == 0).sum()),
+        "commit_size_mean": float(sizes.mean()),
+    }
+
+
+def verify_against_threaded(orders: np.ndarray) -> int:
+    """
+    Run every profile through threaded QProcs with PreferenceOrderEngine and compare the committed set and number
+    of rounds to simulate(). Returns the number of mismatching profiles
+    """
+    from experiments_tests.local_util import create_fully_connected_local_procs
+    from proc.proc import Process
+    from proc.QProc import QProc, PreferenceOrderEngine
+
+    rounds, committed = simulate(orders)
+    batch, n_procs, domain_size = orders.shape
+    domain = [f"c{c}" for c in range(domain_size)]
+    pids = [str(i) for i in range(n_procs)]
+
+    Process.VERBOSE = False
+    mismatches = 0
+    for b in range(batch):
+        engines = [PreferenceOrderEngine(frozenset(domain), [domain[c] for c in orders[b, i]], pids[i]) for i in range(n_procs)]
+        with contextlib.redirect_stdout(io.StringIO()):
+            procs = create_fully_connected_local_procs(QProc, pids, [{"leader_pid": pids[0], "choice_engine": e} for e in engines])
+            procs[pids[0]].start()
+        threaded_choices = procs[pids[0]].await_final_choices()
+        expected_choices = frozenset(domain[c] for c in np.flatnonzero(committed[b]))
+        if threaded_choices != expected_choices or procs[pids[0]].get_rounds() != rounds[b]:
+            mismatches += 1
+    return mismatches
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Monte-Carlo convergence statistics for PreferenceOrderEngine")
+    parser.add_argument("--batch", type=int, default=10000)
+    parser.add_argument("--procs", type=lambda s: [int(x) for x in s.split(",")], default=[3, 10, 50])
+    parser.add_argument("--domains", type=lambda s: [int(x) for x in s.split(",")], default=[3, 10])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verify", type=int, default=0, help="Also check this many profiles per config against threaded QProcs")
+    parser.add_argument("--out", default=None, help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    results = []
+    for n_procs in args.procs:
+        for domain_size in args.domains:
+            orders = random_profiles(rng, args.batch, n_procs, domain_size)
+            result = dict(procs=n_procs, domain=domain_size, **summarize(*simulate(orders)))
+            if args.verify:
+                result["verified"] = args.verify
+                result["mismatches"] = verify_against_threaded(orders[:args.verify])
+            print(result)
+            results.append(result)
+
+    if args.out is not None:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
@@ -1,11 +1,12 @@
 from proc.proc import Process
-from router.router import Router, CountXAcksResponseAccumulator, ResponseAccumulator, CountSpecificAcksResponseAccumulator
+from router.router import Router, CountXAcksResponseAccumulator, ResponseAccumulator, CountSpecificAcksResponseAccumulator, \
+    QuorumDeadlineResponseAccumulator, block_until, now
+from util.decision_log import DecisionLog
 from typing import Any
 from threading import Lock, Condition
 from abc import abstractmethod
-import ollama
-import itertools
-import os
+import functools
+import importlib
 
 
 class ChoiceEngine:
@@ -21,6 +22,11 @@ class ChoiceEngine:
         process that their choice is better. This includes the choices this process made during this round,
         regardless of what the context applies to"""
 
+    def get_context_version(self) -> int | None:
+        """Counter that changes whenever added context may change what get_choices returns, so its result can be reused
+        while the version stays the same. None (the default) if the engine doesn't track this"""
+        return None
+
     # TODO: Consider having leader share which groups of choices were largely chosen, and the quorum. This is useful context for making local decisions
 
     @abstractmethod
@@ -50,11 +56,20 @@ class QProc(Process):
     M_PER_EXC = "PEX"
     M_PER_EXC_RES = "PEX_res"
 
-    def __init__(self, pid: str, router: Router, leader_pid: str, choice_engine: ChoiceEngine):
+    def __init__(self, pid: str, router: Router, leader_pid: str, choice_engine: ChoiceEngine, decision_log: DecisionLog | None = None,
+                 quorum: int | None = None, round_deadline: float = 0.0, decision_id: str | None = None):
+        """If a decision_log is given, commits are made durable in it before taking effect, recorded under decision_id
+        (required then) and this pid, and a decision this process already committed for decision_id (before a restart)
+        is restored as the final choices. The log may be shared with other processes and decisions.
+
+        With a quorum, the leader stops waiting for choices once quorum processes replied and round_deadline seconds
+        passed since the round started (or everyone replied), intersecting only the replies it has. Replies that miss
+        the deadline are folded into the next round for processes that haven't replied to that round. Only useful
+        when routers run handlers on workers, since inline handlers make the leader's broadcast itself wait on them"""
         super().__init__(pid, router)
         self._engine = choice_engine
         self._leader_pid = leader_pid
-        self._pids = list(self._router.get_links().keys())
+        self._pids = self._router.get_pids()
         self._N = len(self._pids)
         self._is_leader = self._pid == leader_pid
 
@@ -62,9 +77,27 @@ class QProc(Process):
         self._final_choices_lock = Lock()
         self._final_choices_cond = Condition(self._final_choices_lock)
 
+        self._decision_log = decision_log
+        self._decision_id = decision_id
+        if decision_log is not None:
+            assert decision_id is not None, "A decision_id is needed to tell this decision's records apart in the log"
+            record = decision_log.find_recovered(decision_id, pid)
+            if record is not None:
+                self._final_choices = record["choices"]
+                self.debug(f"Recovered committed choices {self._final_choices} from decision log")
+
         self._latest_choices = None
         self._latest_choices_context = None
 
+        self._rounds = 0
+        self._round_latencies: list[float] = []
+
+        self._quorum = quorum
+        self._round_deadline = round_deadline
+        # pid -> (round, choices) of replies that missed their round's deadline
+        self._late_choices: dict[str, tuple[int, Any]] = dict()
+        self._late_choices_lock = Lock()
+
     def _initialize_handlers(self):
         self.get_router().add_handler(QProc.M_GET_CHOICES, self._get_choices_req_handler)
         self.get_router().add_handler(QProc.M_COMMIT, self._commit_handler)
@@ -76,16 +109,34 @@ class QProc(Process):
         while True:
             # input("Press ENTER to start next round...")
             rnd += 1
+            self._rounds = rnd
             self.debug(f"Starting round {rnd}")
 
             if self._is_leader:
-                # Ask everyone to return their choices and wait for replies
-                await_all = CountXAcksResponseAccumulator(self._N)
+                round_start = now()
+
+                # Ask everyone to return their choices and wait for replies (or only a quorum, past the deadline)
+                if self._quorum is None:
+                    await_all = CountXAcksResponseAccumulator(self._N)
+                else:
+                    await_all = QuorumDeadlineResponseAccumulator(self._N, self._quorum, self._round_deadline,
+                                                                  functools.partial(self._late_choices_handler, rnd))
                 self.get_router().send_req(self._pids, QProc.M_GET_CHOICES, dict(), await_all)
                 self.debug(f"Broadcasted M_GET_CHOICES request, waiting for replies from all...")
                 pid_to_choices_dict = await_all.wait_for()
                 pid_to_choices_dict = {pid: pid_to_choices_dict[pid]["choices"] for pid in pid_to_choices_dict}
 
+                # Stragglers which missed the previous round's deadline and haven't replied this round count with their
+                # late reply. Older ones predate a perception exchange and are dropped, ones from this round are kept
+                # for the next
+                if self._quorum is not None:
+                    self._late_choices_lock.acquire()
+                    for pid, (late_rnd, choices) in self._late_choices.items():
+                        if late_rnd == rnd - 1 and pid not in pid_to_choices_dict:
+                            pid_to_choices_dict[pid] = choices
+                    self._late_choices = {pid: late for pid, late in self._late_choices.items() if late[0] == rnd}
+                    self._late_choices_lock.release()
+
                 # Compute the intersection of everyone's choices
                 common_choices = self._engine.compute_intersection(set(pid_to_choices_dict.values()))
                 self.debug(f"Got replies! {pid_to_choices_dict}")
@@ -95,11 +146,13 @@ class QProc(Process):
                 if not self._engine.is_choice_set_empty(common_choices):
                     self.debug(f"Sending commit to all... {common_choices}")
                     self.get_router().send_req(self._pids, QProc.M_COMMIT, {"choices": common_choices})
+                    self._round_latencies.append(now() - round_start)
                     break
                 # TODO: Fix this, currently naively terminates with an empty choice set after 5 rounds
                 elif rnd >= 5:
                     self.debug(f"No consensus reached after 5 rounds, committing empty set {common_choices}")
                     self.get_router().send_req(self._pids, QProc.M_COMMIT, {"choices": common_choices})
+                    self._round_latencies.append(now() - round_start)
                     break
 
                 # Otherwise find largest subsets of choice replies which intersect (multiple if tied), union them,
@@ -111,6 +164,13 @@ class QProc(Process):
                     self.get_router().send_req(self._pids, QProc.M_INIT_PER_EXC, dict(), await_all)
                     await_all.wait_for()
                     self.debug(f"Perception exchange complete!")
+                    self._round_latencies.append(now() - round_start)
+
+    def _late_choices_handler(self, rnd: int, src_pid: str, choices: Any):
+        self._late_choices_lock.acquire()
+        self._late_choices[src_pid] = rnd, choices
+        self._late_choices_lock.release()
+        self.debug(f"Late choices {choices} from {src_pid} for round {rnd}, keeping them for the next round")
 
     def _get_choices_req_handler(self, src_pid: str, broadcast_id: int):
         self._latest_choices, self._latest_choices_context = self._engine.get_choices()
@@ -118,7 +178,10 @@ class QProc(Process):
         self.get_router().send_res(src_pid, broadcast_id, {"choices": self._latest_choices})
 
     def _commit_handler(self, src_pid: str, broadcast_id: int, choices: Any):
-        # We are done! Save the final decided choice set and notify anyone waiting
+        # We are done! Save the final decided choice set and notify anyone waiting. Logged first so a decision is
+        # never observed before it is durable
+        if self._decision_log is not None:
+            self._decision_log.append({"decision_id": self._decision_id, "pid": self._pid, "choices": choices})
         self._final_choices_lock.acquire()
         self._final_choices = choices
         self._final_choices_cond.notify_all()
@@ -127,9 +190,14 @@ class QProc(Process):
 
     def _init_perception_exchange_handler(self, src_pid: str, broadcast_id: int):
         # Send my perception to everyone except myself, wait for ACKs, then ACK to leader that I'm done sharing perception
+        # A straggler that has not finished computing any choices yet has no perception to share
+        if self._latest_choices is None:
+            self.get_router().send_res(src_pid, broadcast_id, dict())
+            return
         self.debug(f"Broadcasting own perception context: {self._latest_choices_context}, choices: {self._latest_choices}")
-        await_all = CountXAcksResponseAccumulator(self._N - 1)
-        self.get_router().send_req(self._other_pids, QProc.M_PER_EXC, {"context": self._latest_choices_context, "choices": self._latest_choices}, await_all)
+        other_pids = [pid for pid in self._pids if pid != self._pid]
+        await_all = CountXAcksResponseAccumulator(len(other_pids))
+        self.get_router().send_req(other_pids, QProc.M_PER_EXC, {"context": self._latest_choices_context, "choices": self._latest_choices}, await_all)
         await_all.wait_for()
         self.debug(f"Everyone ACKed my perception broadcast! Replying to leader...")
         self.get_router().send_res(src_pid, broadcast_id, dict())
@@ -142,20 +210,80 @@ class QProc(Process):
 
     """============== PUBLIC =============="""
     def start(self):
-        if self._is_leader:
+        if self._is_leader and self._final_choices is None:
             self._broadcast_get_choices()
 
+    def get_rounds(self) -> int:
+        """Number of rounds the leader has started so far (0 on non-leaders)"""
+        return self._rounds
+
+    def get_round_latencies(self) -> list[float]:
+        """Duration in seconds of each round the leader ran, from broadcasting M_GET_CHOICES to commit or end of exchange"""
+        return self._round_latencies
+
     def await_final_choices(self) -> Any:
         self._final_choices_lock.acquire()
-        if self._final_choices is not None:
-            temp = self._final_choices
-        else:
-            self._final_choices_cond.wait()
-            temp = self._final_choices
+        block_until(self._final_choices_cond, lambda: self._final_choices is not None)
+        temp = self._final_choices
         self._final_choices_lock.release()
         return temp
 
 
+class MemoizedChoiceEngine(ChoiceEngine):
+    """
+    Wraps an engine to reuse the (choices, context) get_choices returned last time for as long as the engine's context
+    version is unchanged, e.g. in rounds where no perception exchange reached this process. Engines without a context
+    version are computed every time
+    """
+    def __init__(self, engine: ChoiceEngine):
+        self.__engine = engine
+        self.__cached_version: int | None = None
+        self.__cached = None
+        self.__hits = 0
+        self.__misses = 0
+        self.__lock = Lock()
+
+    def get_choices(self) -> tuple[Any, Any]:
+        # Version read before computing, so context added meanwhile invalidates what gets cached
+        version = self.__engine.get_context_version()
+        self.__lock.acquire()
+        if version is not None and version == self.__cached_version:
+            self.__hits += 1
+            cached = self.__cached
+            self.__lock.release()
+            return cached
+        self.__misses += 1
+        self.__lock.release()
+
+        result = self.__engine.get_choices()
+        self.__lock.acquire()
+        self.__cached_version, self.__cached = version, result
+        self.__lock.release()
+        return result
+
+    def get_stats(self) -> dict[str, float]:
+        calls = self.__hits + self.__misses
+        return {"hits": self.__hits, "misses": self.__misses, "hit_rate": self.__hits / calls if calls else 0.0}
+
+    def get_context_version(self) -> int | None:
+        return self.__engine.get_context_version()
+
+    def add_context(self, src_pid: str, context: Any, choices: Any):
+        self.__engine.add_context(src_pid, context, choices)
+
+    def compute_intersection(self, choice_sets: set[Any]) -> Any:
+        return self.__engine.compute_intersection(choice_sets)
+
+    def largest_intersecting_subsets(self, choice_sets: list[Any]) -> list[tuple[Any, set[int]]]:
+        return self.__engine.largest_intersecting_subsets(choice_sets)
+
+    def is_choice_set_empty(self, choices: Any):
+        return self.__engine.is_choice_set_empty(choices)
+
+    def is_subset(self, choices: Any, of_choices: Any):
+        return self.__engine.is_subset(choices, of_choices)
+
+
 class PreferenceOrderEngine(ChoiceEngine):
     """
     Everyone ranks choices from 0 to len(choices). Context is this ranking. Choice is the lowest sum of rankings
@@ -167,8 +295,15 @@ class PreferenceOrderEngine(ChoiceEngine):
         self.__preference_orders: dict[str, list[str]] = dict()
         self.__preference_orders[own_pid] = preference_order
         self.__own_pid = own_pid
+        self.__context_version = 0
+        # Contexts arrive on handler threads while get_choices may be running
+        self.__lock = Lock()
+
+    def get_context_version(self) -> int:
+        return self.__context_version
 
     def get_choices(self) -> tuple[frozenset[str], list[str]]:
+        self.__lock.acquire()
         summed_orders = dict()
         for pid in self.__preference_orders:
             for i in range(len(self.__preference_orders[pid])):
@@ -179,10 +314,19 @@ class PreferenceOrderEngine(ChoiceEngine):
         min_choice_sum = min(summed_orders.values())
         choices = [c for c in summed_orders if summed_orders[c] == min_choice_sum]
         print(f"get_choices computation: SUMMED_ORDERS: {summed_orders}, PREFERENCE_ORDERS: {self.__preference_orders}, CHOICES: {choices}")
-        return frozenset(choices), self.__preference_orders[self.__own_pid]
+        own_order = self.__preference_orders[self.__own_pid]
+        self.__lock.release()
+        return frozenset(choices), own_order
 
     def add_context(self, src_pid: str, context: list[str], choices: frozenset[str]):
+        # Processes resend the same order every exchange, only a new or changed one affects the choices. The version
+        # moves after the order is stored, so a get_choices that sees the new version also sees the order
+        self.__lock.acquire()
+        changed = src_pid not in self.__preference_orders or list(self.__preference_orders[src_pid]) != list(context)
         self.__preference_orders[src_pid] = context
+        if changed:
+            self.__context_version += 1
+        self.__lock.release()
 
     def compute_intersection(self, choice_sets: set[frozenset[str]]) -> frozenset[str]:
         choice_sets_list = list(choice_sets)
@@ -201,54 +345,22 @@ class PreferenceOrderEngine(ChoiceEngine):
         return of_choices.issubset(choices)
 
 
-class DiscreteLLMContextEngine(ChoiceEngine):
-    """This engine assumes D is a discrete set of choices, and that LLMs are used to evaluate Q values
-    using association and sensory concepts as described in the research doc"""
-    PROMPT_PATH = os.path.join(os.getcwd(), "z_prompts/QProcDiscreteLLMContextEngine")
-
-    def __init__(self, D: frozenset[str], self_description: str, public_self_description: str):
-        self.__D = D
-        self.__self_description = self_description
-        self.__public_self_description = public_self_description
-        with open(self.PROMPT_PATH, "r") as file:
-            self.__prompt = file.read()
-        self.__contexts = dict()
-
-    def get_choices(self) -> tuple[Any, Any]:
-
-        context = {"choice_specific": {}, "self_description": self.__self_description}
-
-    def add_context(self, src_pid: str, context: dict[str, str], choices: set[str]):
-        if src_pid in self.__contexts:
-            self.__contexts[src_pid] += context
-
-    def compute_intersection(self, choice_sets: set[frozenset[str]]) -> set[str]:
-        choice_sets = list(choice_sets)
-        accum = choice_sets[0]
-        for i in range(1, len(choice_sets)):
-            accum = accum.intersection(choice_sets[i])
-        return accum
-
-    def largest_intersecting_subsets(self, choice_sets: list[frozenset[str]]) -> list[tuple[set[str], set[int]]]:
-        done = False
-        output = []
-        for i in range(len(choice_sets), 0, -1):
-            # Every combination of size i
-            for comb in itertools.combinations(range(len(choice_sets)), i):
-                comb_choice_set = {choice_sets[j] for j in comb}
-                common = self.compute_intersection(comb_choice_set)
-                if not self.is_choice_set_empty(common):
-                    done = True
-                    output.append((common, set(comb)))
-            if done:
-                break
-        return output
-
-    def is_choice_set_empty(self, choices: set[str]):
-        return len(choices) == 0
+# Choice engines by name, as "module:class". Engines with heavy optional dependencies (LLM clients, numpy, ...) live in
+# their own modules so that importing QProc, or running experiments with the lightweight engines, never loads them
+ENGINE_PLUGINS = {
+    "preference_order": "proc.QProc:PreferenceOrderEngine",
+    "discrete_llm_context": "proc.llm_engine:DiscreteLLMContextEngine",
+}
 
-    def is_subset(self, choices: set[str], of_choices: set[str]):
-        return choices.issubset(of_choices)
 
+def load_engine(name: str) -> type[ChoiceEngine]:
+    """Import and return the engine class registered under name in ENGINE_PLUGINS"""
+    module_name, class_name = ENGINE_PLUGINS[name].split(":")
+    return getattr(importlib.import_module(module_name), class_name)
 
 
+def __getattr__(name: str):
+    # Keeps `from proc.QProc import DiscreteLLMContextEngine` working while only loading it on first access
+    if name == "DiscreteLLMContextEngine":
+        return load_engine("discrete_llm_context")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
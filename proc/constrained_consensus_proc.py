@@ -54,7 +54,8 @@ Normalization of penalties across LLMs is pairwise communication, i.e who should
 import datetime
 
 from proc.proc import Process
-from router.router import Router
+from router.router import Router, block_until
+from util.decision_log import DecisionLog
 from threading import Lock, Condition
 import time
 
@@ -63,7 +64,8 @@ class ConstrainedConsensusProc(Process):
     MSG_CONSTRAINTS = "constraints"
     MSG_PROPOSE = "propose"
 
-    def __init__(self, pid: str, router: Router, pids: list[str], leader_pid: str):
+    def __init__(self, pid: str, router: Router, pids: list[str], leader_pid: str, decision_log: DecisionLog | None = None,
+                 decision_id: str | None = None):
         super().__init__(pid, router)
         self._all_pids = pids
         self._leader_pid = leader_pid
@@ -73,11 +75,23 @@ class ConstrainedConsensusProc(Process):
         self.__constraints = set()
         self.__desired_interval = 0.5 * 60 * 60
         self.__received_pids = set()
+        # A value some process already accepted (recovered from its log) and reported along with its constraints
+        self.__reported_v = None
 
         self.__lock = Lock()
         self.__condition = Condition(self.__lock)
         self.__v = None
 
+        # Proposals are logged under (decision_id, pid) before being accepted, a value this process already accepted for
+        # decision_id (from before a restart) is restored. The log may be shared with other processes and decisions
+        self.__decision_log = decision_log
+        self.__decision_id = decision_id
+        if decision_log is not None:
+            assert decision_id is not None, "A decision_id is needed to tell this decision's records apart in the log"
+            record = decision_log.find_recovered(decision_id, pid)
+            if record is not None:
+                self.__v = record["time_range_val"]
+
         self.__proposed_lock = Lock()
         self.__proposed = False
 
@@ -85,23 +99,36 @@ class ConstrainedConsensusProc(Process):
         self._router.add_handler(self.MSG_CONSTRAINTS, self.__constraints_handler)
         self._router.add_handler(self.MSG_PROPOSE, self.__propose_handler)
 
-    def __constraints_handler(self, src_pid: str, constraints: list[float, float]):
+    def __constraints_handler(self, src_pid: str, broadcast_id: int, constraints: list[float, float],
+                              decided: tuple[float, float] | None = None):
         for c in constraints:
             self.__constraints.add(c)
         self.__received_pids.add(src_pid)
-        self.debug(f"Received constraints {constraints} from {src_pid}")
+        self.debug(f"Received constraints {constraints} from {src_pid}" + (f", already decided {decided}" if decided is not None else ""))
 
         self.__proposed_lock.acquire()
+        if decided is not None and self.__reported_v is None:
+            self.__reported_v = tuple(decided)
         if len(self.__received_pids) == self._n and not self.__proposed:
             self.__proposed = True
-            self.debug(f"All constraints received! Solving CSP and broadcasting proposal...")
-            self._router.send(self._all_pids, self.MSG_PROPOSE, {"time_range_val": self.__solve_csp()})
+            # A value accepted before a restart was possibly returned to clients already, it must not change
+            if self.__reported_v is not None:
+                self.debug(f"All constraints received! Re-broadcasting already decided {self.__reported_v}...")
+                value = self.__reported_v
+            else:
+                self.debug(f"All constraints received! Solving CSP and broadcasting proposal...")
+                value = self.__solve_csp()
+            self._router.send_req(self._all_pids, self.MSG_PROPOSE, {"time_range_val": value})
         self.__proposed_lock.release()
 
-    def __propose_handler(self, src_pid: str, time_range_val: tuple[float, float]):
+    def __propose_handler(self, src_pid: str, broadcast_id: int, time_range_val: tuple[float, float]):
         self.debug(f"Received proposal from {src_pid} with value {time_range_val}")
-        self.__v = time_range_val
         self.__lock.acquire()
+        # Once accepted (possibly before a restart) the value is final, later proposals are neither taken nor logged
+        if self.__v is None:
+            if self.__decision_log is not None:
+                self.__decision_log.append({"decision_id": self.__decision_id, "pid": self._pid, "time_range_val": time_range_val})
+            self.__v = time_range_val
         self.__condition.notify_all()
         self.__lock.release()
 
@@ -127,14 +154,21 @@ class ConstrainedConsensusProc(Process):
     """ ======================== PUBLIC =========================== """
 
     def agree_on_value(self, constraints: list[float, float]):
+        if self.__v is not None:
+            # Others may have restarted without having logged the decision, so the leader still needs our constraints,
+            # and the decided value so it re-proposes that instead of solving again
+            self._router.send_req([self._leader_pid], self.MSG_CONSTRAINTS, {"constraints": constraints, "decided": self.__v})
+            self.debug(f"Value {self.__v} already decided, returning it")
+            return self.__v
+
         self.debug(f"Received client request with {constraints}, sending to Leader {self._leader_pid}")
-        self._router.send([self._leader_pid], self.MSG_CONSTRAINTS, {"constraints": constraints})
+        self._router.send_req([self._leader_pid], self.MSG_CONSTRAINTS, {"constraints": constraints})
 
         self.debug(f"Waiting for value...")
-        if self.__v is None:
-            self.__lock.acquire()
-            self.__condition.wait()
-            self.__lock.release()
+        # Checked under the lock so a proposal landing between the check and the wait is not missed
+        self.__lock.acquire()
+        block_until(self.__condition, lambda: self.__v is not None)
+        self.__lock.release()
         self.debug(f"Returning value {self.__v}")
 
         return self.__v
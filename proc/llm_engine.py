@@ -0,0 +1,113 @@
+"""
+Choice engines backed by LLMs. Loaded lazily through proc.QProc.ENGINE_PLUGINS so that the LLM client and numpy are
+only imported by processes that actually use these engines
+"""
+from __future__ import annotations
+from proc.QProc import ChoiceEngine
+from util.vector_index import EmbeddingIndex
+from typing import Any, Callable, Sequence
+from threading import Lock
+import numpy as np
+import ollama
+import itertools
+import os
+
+
+class DiscreteLLMContextEngine(ChoiceEngine):
+    """This engine assumes D is a discrete set of choices, and that LLMs are used to evaluate Q values
+    using association and sensory concepts as described in the research doc"""
+    PROMPT_PATH = os.path.join(os.getcwd(), "z_prompts/QProcDiscreteLLMContextEngine")
+
+    def __init__(self, D: frozenset[str], self_description: str, public_self_description: str,
+                 embed: Callable[[Sequence[str]], np.ndarray] | None = None):
+        """
+        embed maps a batch of texts to a matrix of embeddings (e.g. EmbeddingStore.embed_texts). If given, received
+        contexts are indexed so the ones relevant to each choice can be retrieved with relevant_contexts
+        """
+        self.__D = D
+        self.__self_description = self_description
+        self.__public_self_description = public_self_description
+        with open(self.PROMPT_PATH, "r") as file:
+            self.__prompt = file.read()
+        self.__contexts = dict()
+        self.__embed = embed
+        self.__context_index: EmbeddingIndex | None = None
+        self.__context_version = 0
+        self.__context_lock = Lock()
+
+    def get_context_version(self) -> int:
+        return self.__context_version
+
+    def get_choices(self) -> tuple[Any, Any]:
+
+        context = {"choice_specific": {}, "self_description": self.__self_description}
+
+    def add_context(self, src_pid: str, context: dict[str, Any], choices: set[str]):
+        # The version only moves once the context is fully stored and indexed, so a get_choices that sees the new
+        # version also sees the context
+        self.__context_lock.acquire()
+        if src_pid not in self.__contexts:
+            self.__contexts[src_pid] = []
+        self.__contexts[src_pid].append(context)
+        if self.__embed is not None:
+            self.__index_context(src_pid, context)
+        self.__context_version += 1
+        self.__context_lock.release()
+
+    def __index_context(self, src_pid: str, context: dict[str, Any]):
+        """Index each piece of a context under (src_pid, choice), a newer context from src_pid replaces older pieces"""
+        ids, texts, metadatas = [], [], []
+        for choice, text in context.get("choice_specific", dict()).items():
+            ids.append(f"{src_pid}/choice/{choice}")
+            texts.append(text)
+            metadatas.append({"src_pid": src_pid, "choice": choice, "text": text})
+        if "self_description" in context:
+            ids.append(f"{src_pid}/self_description")
+            texts.append(context["self_description"])
+            metadatas.append({"src_pid": src_pid, "choice": None, "text": context["self_description"]})
+        if not len(ids):
+            return
+
+        vectors = self.__embed(texts)
+        if self.__context_index is None:
+            self.__context_index = EmbeddingIndex(vectors.shape[1])
+        self.__context_index.add(ids, vectors, metadatas)
+
+    def relevant_contexts(self, choices: Sequence[str], k: int = 5, src_pid: str | None = None) -> dict[str, list[str]]:
+        """
+        For each choice, the k received context texts most similar to it (optionally only those from src_pid), found
+        with one batched search over the context index
+        """
+        if self.__context_index is None:
+            return {c: [] for c in choices}
+        where = None if src_pid is None else {"src_pid": src_pid}
+        results = self.__context_index.query(self.__embed(list(choices)), k, where)
+        return {choices[i]: [md["text"] for _, _, md in results[i]] for i in range(len(choices))}
+
+    def compute_intersection(self, choice_sets: set[frozenset[str]]) -> set[str]:
+        choice_sets = list(choice_sets)
+        accum = choice_sets[0]
+        for i in range(1, len(choice_sets)):
+            accum = accum.intersection(choice_sets[i])
+        return accum
+
+    def largest_intersecting_subsets(self, choice_sets: list[frozenset[str]]) -> list[tuple[set[str], set[int]]]:
+        done = False
+        output = []
+        for i in range(len(choice_sets), 0, -1):
+            # Every combination of size i
+            for comb in itertools.combinations(range(len(choice_sets)), i):
+                comb_choice_set = {choice_sets[j] for j in comb}
+                common = self.compute_intersection(comb_choice_set)
+                if not self.is_choice_set_empty(common):
+                    done = True
+                    output.append((common, set(comb)))
+            if done:
+                break
+        return output
+
+    def is_choice_set_empty(self, choices: set[str]):
+        return len(choices) == 0
+
+    def is_subset(self, choices: set[str], of_choices: set[str]):
+        return choices.issubset(of_choices)
@@ -8,10 +8,13 @@ PRINT_LOCK = Lock()
 
 
 class Process:
+    # Set to False to silence debug output, e.g. when benchmarking (debug inspects the call stack on every call)
+    VERBOSE = True
+
     def __init__(self, pid: str, router: Router):
         self._pid = pid
         self._router = router
-        self._other_pids = list(self._router.get_links().keys())
+        self._other_pids = self._router.get_pids()
 
         self._initialize_handlers()
 
@@ -26,6 +29,8 @@ class Process:
         return self._router
 
     def debug(self, msg: str):
+        if not Process.VERBOSE:
+            return
         PRINT_LOCK.acquire()
         print(f"[{self._pid}][{inspect.stack()[1][3]}] {msg}")
         PRINT_LOCK.release()
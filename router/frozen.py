@@ -0,0 +1,61 @@
+"""
+Read-only payloads that in-process receivers can share without copying. freeze() turns a message's params into an
+immutable structure once per send (dicts become FrozenDicts, lists tuples, sets frozensets, numpy arrays read-only
+views), after which every LocalLink receiver is handed the same object. Mutating it raises TypeError (ValueError for
+arrays) instead of silently changing what the other receivers see.
+
+Values freeze() does not know how to make immutable (arbitrary objects, bytearrays, ...) are rejected with a TypeError
+in debug builds, under python -O they are passed along as they are
+"""
+from __future__ import annotations
+from typing import Any
+import sys
+
+_IMMUTABLE_TYPES = (str, bytes, int, float, complex, bool, type(None), range)
+
+
+def _read_only(self, *args, **kwargs):
+    raise TypeError(f"{type(self).__name__} is read-only, copy it with dict(...) to modify")
+
+
+class FrozenDict(dict):
+    """dict that refuses to be modified. Still a dict, so it can be ** unpacked, pickled and compared as usual"""
+    __setitem__ = __delitem__ = __ior__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+    def __reduce__(self):
+        return FrozenDict, (dict(self),)
+
+    def __repr__(self) -> str:
+        return f"FrozenDict({dict.__repr__(self)})"
+
+
+def freeze(value: Any) -> Any:
+    """Immutable deep equivalent of value, sharing what already is immutable (including FrozenDicts) instead of copying"""
+    if isinstance(value, _IMMUTABLE_TYPES) or type(value) is FrozenDict:
+        return value
+    if isinstance(value, dict):
+        return FrozenDict((k, freeze(v)) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        frozen = tuple(freeze(v) for v in value)
+        # Keep tuples (and namedtuples) whose items were already immutable as the very same object
+        return value if type(value) is not list and all(f is v for f, v in zip(frozen, value)) else frozen
+    if isinstance(value, (set, frozenset)):
+        # Set items are hashable, and so already treated as immutable
+        return value if type(value) is frozenset else frozenset(value)
+
+    # Only look for numpy arrays if numpy was imported by someone, freezing must not import it
+    np = sys.modules.get("numpy")
+    if np is not None:
+        if isinstance(value, np.ndarray):
+            if not value.flags.writeable:
+                return value
+            view = value.view()
+            view.flags.writeable = False
+            return view
+        if isinstance(value, np.generic):
+            return value
+
+    if __debug__:
+        raise TypeError(f"Cannot freeze {type(value).__name__} for sharing between receivers")
+    return value
@@ -2,12 +2,58 @@ from __future__ import annotations
 from threading import Thread, Lock, Condition
 from typing import Callable, Any
 from abc import abstractmethod
+import queue
+import time
+import traceback
+from router.topology import Topology
+from router.frozen import freeze
 
 #####################################################
 # ------------            BASE          ----------- #
 #####################################################
 
 
+class EventPump:
+    """
+    Drives message delivery while a process blocks. Installed by single-threaded simulators (see router.simulated) so
+    that blocking waits run pending events instead of sleeping on a condition nobody else can notify
+    """
+    @abstractmethod
+    def run_until(self, predicate: Callable[[], bool], timeout: float | None = None) -> bool:
+        """Process events until predicate holds (return True) or timeout elapses (return predicate())"""
+
+    @abstractmethod
+    def now(self) -> float:
+        """Current (possibly virtual) time in seconds"""
+
+
+_event_pump: EventPump | None = None
+
+
+def set_event_pump(pump: EventPump | None):
+    global _event_pump
+    _event_pump = pump
+
+
+def now() -> float:
+    """Monotonic time in seconds, virtual time while an EventPump is installed. Use for deadlines inside processes"""
+    return time.monotonic() if _event_pump is None else _event_pump.now()
+
+
+def block_until(cond: Condition, predicate: Callable[[], bool], timeout: float | None = None) -> bool:
+    """
+    Wait on cond until predicate holds, the caller must hold cond's lock. Under an installed EventPump the lock is
+    released while the pump delivers events, otherwise this is cond.wait_for
+    """
+    if _event_pump is None:
+        return cond.wait_for(predicate, timeout)
+    cond.release()
+    try:
+        return _event_pump.run_until(predicate, timeout)
+    finally:
+        cond.acquire()
+
+
 class ResponseAccumulator:
     @abstractmethod
     def response_handler(self, src_pid: str, *args, **kwargs):
@@ -18,6 +64,10 @@ class ResponseAccumulator:
         """Once enough replies are accumulated, reply"""
 
 
+class LinkSaturatedError(Exception):
+    """Raised to a sender when the destination's inbound queue for the link is full"""
+
+
 class Link:
     def __init__(self):
         self._on_receive: Callable[[dict], None] = lambda x: x
@@ -31,7 +81,31 @@ class Link:
 
 
 class Router:
-    def __init__(self):
+    SATURATION_BLOCK = "block"
+    SATURATION_ERROR = "error"
+
+    def __init__(self, pid: str | None = None, topology: Topology | None = None, connector: Callable[[str, str], None] | None = None,
+                 workers: int | None = None, queue_size: int = 1024, on_saturated: str = SATURATION_BLOCK, send_timeout: float | None = None,
+                 freeze_payloads: bool = False):
+        """
+        Without a topology, links are registered explicitly with register_link and only those pids are reachable. With
+        a topology, links to neighbors are created on first use by calling connector(pid, neighbor_pid), which must
+        register the link on this router, and messages to non-neighbors are forwarded hop by hop.
+
+        By default request handlers run inline on whichever thread delivered the message. With workers set, every link
+        gets a bounded inbound queue of queue_size requests drained by a fixed pool of that many handler threads. When
+        a queue is full the sender blocks (SATURATION_BLOCK, raising LinkSaturatedError after send_timeout if set) or
+        gets LinkSaturatedError straight away (SATURATION_ERROR). Responses and relayed messages never queue, they are
+        handled inline so handlers blocked waiting on replies cannot starve them. Handlers that wait on requests to
+        other processes need workers >= 2
+
+        With freeze_payloads, the params of every request and response are frozen once before sending (see
+        router.frozen). Over LocalLinks all receivers of a broadcast then share one read-only copy of them, so handlers
+        and engines can keep received values without copying them first
+        """
+        self.__pid = pid
+        self.__topology = topology
+        self.__connector = connector
         self.__routes: dict[str, Link] = dict()
         self.__req_handlers: dict[str, Callable[[str, Any, ...], None]] = dict()
         self.__accumulators: dict[int, tuple[ResponseAccumulator, set[str], set[str]]] = dict()
@@ -39,6 +113,22 @@ class Router:
         self.__latest_broadcast_id = 0
         self.__broadcast_id_lock = Lock()
 
+        self.__workers = workers
+        self.__queue_size = queue_size
+        self.__on_saturated = on_saturated
+        self.__send_timeout = send_timeout
+        self.__freeze_payloads = freeze_payloads
+        self.__inbound: dict[str, queue.Queue] = dict()
+        self.__queue_stats: dict[str, dict[str, int]] = dict()
+        self.__queue_stats_lock = Lock()
+        # One entry per queued request naming the link it is queued on, workers take whichever request is next overall
+        self.__ready: queue.SimpleQueue = queue.SimpleQueue()
+        self.__worker_threads = []
+        if workers is not None:
+            for _ in range(workers):
+                self.__worker_threads.append(Thread(target=self.__worker_loop, daemon=True))
+                self.__worker_threads[-1].start()
+
     def __get_next_broadcast_id(self):
         self.__broadcast_id_lock.acquire()
         self.__latest_broadcast_id += 1
@@ -47,31 +137,123 @@ class Router:
         return broadcast_id
 
     def get_links(self) -> dict[str, Link]:
+        """Links created so far (with a topology, only those to neighbors that were already messaged)"""
         return self.__routes
 
+    def get_pids(self) -> list[str]:
+        """Every pid reachable from this router, including its own"""
+        if self.__topology is not None:
+            return self.__topology.get_pids()
+        return list(self.__routes.keys())
+
+    def __get_link(self, pid: str) -> Link:
+        if pid not in self.__routes and self.__connector is not None:
+            self.__connector(self.__pid, pid)
+        return self.__routes[pid]
+
+    def __send_payload(self, target_pid: str, payload: dict):
+        # Wrap messages to non-neighbors with their final destination and hand them to the next hop
+        if self.__topology is not None and not self.__topology.is_neighbor(self.__pid, target_pid):
+            payload = {"forward_to": target_pid, "origin": self.__pid, "payload": payload}
+            target_pid = self.__topology.next_hop(self.__pid, target_pid)
+        self.__get_link(target_pid).reliably_send(payload)
+
     def send_req(self, target_pids: list[str], message_type: str, params: dict, accum: ResponseAccumulator | None = None):
         """
         Broadcast a request to one or more processes and optionally specify a response accumulator to collect
         replies
         """
         broadcast_id = self.__get_next_broadcast_id()
+        if self.__freeze_payloads:
+            params = freeze(params)
         if accum is not None:
             self.__accumulators[broadcast_id] = accum, set(target_pids), set()
         for pid in target_pids:
-            self.__routes[pid].reliably_send({"message_type": message_type, "broadcast_id": broadcast_id, "params": params})
+            self.__send_payload(pid, {"message_type": message_type, "broadcast_id": broadcast_id, "params": params})
 
     def send_res(self, target_pid: str, broadcast_id: int, params: dict):
         """
         Reply to the request with the given broadcast_id from the given target_pid process
         """
-        self.__routes[target_pid].reliably_send({"broadcast_id": broadcast_id, "params": params})
+        if self.__freeze_payloads:
+            params = freeze(params)
+        self.__send_payload(target_pid, {"broadcast_id": broadcast_id, "params": params})
 
     def register_link(self, target_pid: str, link: Link):
         assert target_pid not in self.__routes
+        if self.__workers is not None:
+            self.__inbound[target_pid] = queue.Queue(self.__queue_size)
+            self.__queue_stats[target_pid] = {"enqueued": 0, "processed": 0, "dropped": 0, "max_depth": 0}
+            link.add_on_receive(lambda payload: self.__enqueue(target_pid, payload))
+        else:
+            link.add_on_receive(lambda payload: self.__on_receive(target_pid, payload))
         self.__routes[target_pid] = link
-        link.add_on_receive(lambda payload: self.__on_receive(target_pid, payload))
+
+    def __enqueue(self, source_pid: str, payload: dict):
+        # Only requests for this router queue, see __init__
+        is_request = "message_type" in payload or ("forward_to" in payload and payload["forward_to"] == self.__pid and "message_type" in payload["payload"])
+        if not is_request:
+            self.__on_receive(source_pid, payload)
+            return
+
+        inbound = self.__inbound[source_pid]
+        stats = self.__queue_stats[source_pid]
+        try:
+            if self.__on_saturated == Router.SATURATION_BLOCK:
+                inbound.put(payload, timeout=self.__send_timeout)
+            else:
+                inbound.put_nowait(payload)
+        except queue.Full:
+            self.__queue_stats_lock.acquire()
+            stats["dropped"] += 1
+            self.__queue_stats_lock.release()
+            raise LinkSaturatedError(f"Inbound queue from {source_pid} to {self.__pid} is full ({self.__queue_size} requests)")
+
+        self.__queue_stats_lock.acquire()
+        stats["enqueued"] += 1
+        stats["max_depth"] = max(stats["max_depth"], inbound.qsize())
+        self.__queue_stats_lock.release()
+        self.__ready.put(source_pid)
+
+    def __worker_loop(self):
+        while True:
+            source_pid = self.__ready.get()
+            if source_pid is None:
+                return
+            # A failing handler must not take its worker down with it, the pool is fixed and the router would stall
+            try:
+                self.__on_receive(source_pid, self.__inbound[source_pid].get_nowait())
+            except Exception:
+                traceback.print_exc()
+            finally:
+                self.__queue_stats_lock.acquire()
+                self.__queue_stats[source_pid]["processed"] += 1
+                self.__queue_stats_lock.release()
+
+    def get_queue_stats(self) -> dict[str, dict[str, int]]:
+        """Per link inbound queue counters (current depth, max depth, enqueued, processed, dropped), empty without workers"""
+        self.__queue_stats_lock.acquire()
+        stats = {pid: dict(self.__queue_stats[pid], depth=self.__inbound[pid].qsize()) for pid in self.__queue_stats}
+        self.__queue_stats_lock.release()
+        return stats
+
+    def shutdown(self):
+        """Stop the handler workers once they drained what is already queued"""
+        for _ in self.__worker_threads:
+            self.__ready.put(None)
+        for t in self.__worker_threads:
+            t.join()
+        self.__worker_threads = []
 
     def __on_receive(self, source_pid: str, payload: dict):
+        # Forwarded message, relay it onwards unless it is addressed to us
+        if "forward_to" in payload:
+            if payload["forward_to"] != self.__pid:
+                self.__get_link(self.__topology.next_hop(self.__pid, payload["forward_to"])).reliably_send(payload)
+                return
+            source_pid = payload["origin"]
+            payload = payload["payload"]
+
         # Req message
         if "message_type" in payload:
             if payload["message_type"] in self.__req_handlers:
@@ -96,6 +278,10 @@ class Router:
 
 
 class LocalLink(Link):
+    """
+    In-process link. The payload object itself is handed to the receiving router, nothing is copied or serialized, so
+    senders should not modify params after sending them (or use a Router with freeze_payloads)
+    """
     def __init__(self):
         super().__init__()
         self.__other_link = None
@@ -109,6 +295,38 @@ class LocalLink(Link):
         Thread(target=self.__other_link._on_receive(payload)).start()
 
 
+class LocalNetwork:
+    """
+    Creates connected LocalLink pairs between routers on demand. Pass connect as the connector of every Router in the
+    network so links only exist between neighbors that actually exchanged messages
+    """
+    def __init__(self):
+        self.__routers: dict[str, Router] = dict()
+        self.__lock = Lock()
+
+    def add_router(self, pid: str, router: Router):
+        self.__routers[pid] = router
+
+    def _make_link(self, pid: str, other_pid: str) -> Link:
+        """Create the (not yet connected) link pid uses to send to other_pid"""
+        return LocalLink()
+
+    def connect(self, pid: str, other_pid: str):
+        self.__lock.acquire()
+        # The other side may have connected to us first, in which case both links already exist
+        if other_pid not in self.__routers[pid].get_links():
+            link = self._make_link(pid, other_pid)
+            self.__routers[pid].register_link(other_pid, link)
+            if pid == other_pid:
+                link.set_target_link(link)
+            else:
+                other_link = self._make_link(other_pid, pid)
+                self.__routers[other_pid].register_link(pid, other_link)
+                link.set_target_link(other_link)
+                other_link.set_target_link(link)
+        self.__lock.release()
+
+
 class CountXAcksResponseAccumulator(ResponseAccumulator):
     """
     Wait for an integer number of replies to come in and return those replies in a dictionary by pid
@@ -130,8 +348,7 @@ class CountXAcksResponseAccumulator(ResponseAccumulator):
 
     def wait_for(self) -> dict[str, dict]:
         self.__lock.acquire()
-        if not self.__is_done:
-            self.__cond.wait()
+        block_until(self.__cond, lambda: self.__is_done)
         temp = self.__replies
         self.__lock.release()
         return temp
@@ -158,8 +375,48 @@ class CountSpecificAcksResponseAccumulator(ResponseAccumulator):
 
     def wait_for(self) -> dict[str, dict]:
         self.__lock.acquire()
-        if not self.__is_done:
-            self.__cond.wait()
+        block_until(self.__cond, lambda: self.__is_done)
         temp = self.__replies
         self.__lock.release()
         return temp
+
+
+class QuorumDeadlineResponseAccumulator(ResponseAccumulator):
+    """
+    Wait until either every one of num_total replies is in, or at least quorum replies are in and deadline seconds
+    have passed since creation (if the deadline passes first, keep waiting for the quorum). Replies arriving after
+    wait_for returned are passed to on_late instead
+    """
+    def __init__(self, num_total: int, quorum: int, deadline: float, on_late: Callable[..., None] | None = None):
+        self.__num_total = num_total
+        self.__quorum = min(quorum, num_total)
+        self.__deadline_at = now() + deadline
+        self.__on_late = on_late
+        self.__replies = dict()
+        self.__lock = Lock()
+        self.__cond = Condition(self.__lock)
+        self.__is_done = False
+
+    def __ready(self) -> bool:
+        return len(self.__replies) >= self.__num_total or (len(self.__replies) >= self.__quorum and now() >= self.__deadline_at)
+
+    def response_handler(self, src_pid: str, **kwargs):
+        self.__lock.acquire()
+        if self.__is_done:
+            self.__lock.release()
+            if self.__on_late is not None:
+                self.__on_late(src_pid, **kwargs)
+            return
+        self.__replies[src_pid] = kwargs
+        if self.__ready():
+            self.__cond.notify_all()
+        self.__lock.release()
+
+    def wait_for(self) -> dict[str, dict]:
+        self.__lock.acquire()
+        block_until(self.__cond, self.__ready, max(self.__deadline_at - now(), 0))
+        block_until(self.__cond, lambda: len(self.__replies) >= self.__quorum)
+        self.__is_done = True
+        temp = dict(self.__replies)
+        self.__lock.release()
+        return temp
@@ -0,0 +1,180 @@
+"""
+Deterministic discrete-event network simulation. Every process runs on the calling thread against a virtual clock,
+messages are delivered by a seeded scheduler after a sampled per-link latency, and drops are retransmitted so links
+stay reliable. Blocking waits inside processes (accumulators, await_final_choices, ...) pump the scheduler through
+router.block_until instead of sleeping, so the existing process code runs unmodified.
+
+    sim = NetworkSimulator(seed=1, latency=UniformLatency(0.001, 0.02), drop_rate=0.01)
+    with sim:
+        procs = create_local_procs(QProc, pids, params, network=sim)
+        procs[leader_pid].start()
+        sim.run()
+
+The same seed (and PYTHONHASHSEED, which affects set iteration order inside processes) replays the exact same run.
+Blocking waits nest, so deep protocols recurse once per concurrently blocked handler, the recursion limit is raised on
+entering the simulator accordingly
+"""
+from __future__ import annotations
+from abc import abstractmethod
+from typing import Callable
+import heapq
+import math
+import random
+import sys
+
+from router.router import Link, LocalNetwork, EventPump, set_event_pump
+
+
+class LatencyModel:
+    @abstractmethod
+    def sample(self, rng: random.Random) -> float:
+        """Draw a one-way delivery latency in virtual seconds"""
+
+
+class ConstantLatency(LatencyModel):
+    def __init__(self, latency: float):
+        self.__latency = latency
+
+    def sample(self, rng: random.Random) -> float:
+        return self.__latency
+
+
+class UniformLatency(LatencyModel):
+    def __init__(self, low: float, high: float):
+        self.__low = low
+        self.__high = high
+
+    def sample(self, rng: random.Random) -> float:
+        return rng.uniform(self.__low, self.__high)
+
+
+class LogNormalLatency(LatencyModel):
+    """Heavy-tailed latency with the given median, sigma controls the tail"""
+    def __init__(self, median: float, sigma: float):
+        self.__mu = math.log(median)
+        self.__sigma = sigma
+
+    def sample(self, rng: random.Random) -> float:
+        return rng.lognormvariate(self.__mu, self.__sigma)
+
+
+class SimulatedLink(Link):
+    """
+    Link whose messages are delivered by the simulator after a sampled latency. Each transmission is dropped with
+    probability drop_rate and retransmitted after retransmit_timeout, so reliably_send still delivers exactly once
+    """
+    def __init__(self, simulator: NetworkSimulator, latency: LatencyModel, drop_rate: float, retransmit_timeout: float):
+        super().__init__()
+        self.__simulator = simulator
+        self.__latency = latency
+        self.__drop_rate = drop_rate
+        self.__retransmit_timeout = retransmit_timeout
+        self.__other_link = None
+
+    def set_target_link(self, other_link: SimulatedLink):
+        self.__other_link = other_link
+
+    def reliably_send(self, payload: dict):
+        if self.__other_link is None:
+            raise Exception("Link not connected!!")
+        self.__transmit(payload)
+
+    def __transmit(self, payload: dict):
+        rng = self.__simulator.get_rng()
+        if rng.random() < self.__drop_rate:
+            self.__simulator.record_drop()
+            self.__simulator.schedule(self.__retransmit_timeout, lambda: self.__transmit(payload))
+        else:
+            self.__simulator.schedule(self.__latency.sample(rng), lambda: self.__deliver(payload))
+
+    def __deliver(self, payload: dict):
+        self.__simulator.record_delivery()
+        self.__other_link._on_receive(payload)
+
+
+class NetworkSimulator(LocalNetwork, EventPump):
+    """
+    Virtual clock, seeded event scheduler and network of SimulatedLinks. Use as the network of create_local_procs, and
+    enter it (with) while the processes run so blocking waits pump its events
+    """
+    def __init__(self, seed: int = 0, latency: LatencyModel | None = None, drop_rate: float = 0.0, retransmit_timeout: float = 0.2):
+        super().__init__()
+        self.__rng = random.Random(seed)
+        self.__now = 0.0
+        self.__events: list[tuple[float, int, Callable[[], None]]] = []
+        self.__seq = 0
+
+        self.__latency = latency if latency is not None else ConstantLatency(0.001)
+        self.__drop_rate = drop_rate
+        self.__retransmit_timeout = retransmit_timeout
+        self.__link_params: dict[tuple[str, str], tuple[LatencyModel, float]] = dict()
+
+        self.__delivered = 0
+        self.__dropped = 0
+        self.__prev_recursion_limit = None
+
+    def __enter__(self) -> NetworkSimulator:
+        self.__prev_recursion_limit = sys.getrecursionlimit()
+        sys.setrecursionlimit(max(self.__prev_recursion_limit, 200000))
+        set_event_pump(self)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        set_event_pump(None)
+        sys.setrecursionlimit(self.__prev_recursion_limit)
+
+    def set_link_params(self, pid: str, other_pid: str, latency: LatencyModel, drop_rate: float = 0.0):
+        """Override latency and drop rate of the pid -> other_pid direction, must be set before the link is created"""
+        self.__link_params[(pid, other_pid)] = latency, drop_rate
+
+    def _make_link(self, pid: str, other_pid: str) -> SimulatedLink:
+        latency, drop_rate = self.__link_params.get((pid, other_pid), (self.__latency, self.__drop_rate))
+        return self._new_link(latency, drop_rate, self.__retransmit_timeout)
+
+    def _new_link(self, latency: LatencyModel, drop_rate: float, retransmit_timeout: float) -> SimulatedLink:
+        """Create a link with the given parameters, override to use a SimulatedLink subclass"""
+        return SimulatedLink(self, latency, drop_rate, retransmit_timeout)
+
+    def get_rng(self) -> random.Random:
+        return self.__rng
+
+    def now(self) -> float:
+        return self.__now
+
+    def schedule(self, delay: float, callback: Callable[[], None]):
+        # seq breaks ties between events at the same virtual time in scheduling order, keeping runs deterministic
+        self.__seq += 1
+        heapq.heappush(self.__events, (self.__now + delay, self.__seq, callback))
+
+    def record_delivery(self):
+        self.__delivered += 1
+
+    def record_drop(self):
+        self.__dropped += 1
+
+    def get_stats(self) -> dict[str, float]:
+        return {"virtual_time": self.__now, "delivered": self.__delivered, "dropped": self.__dropped, "pending": len(self.__events)}
+
+    def step(self) -> bool:
+        """Run the next event, advancing the clock to it. Returns False if there was nothing to run"""
+        if not len(self.__events):
+            return False
+        t, _, callback = heapq.heappop(self.__events)
+        self.__now = t
+        callback()
+        return True
+
+    def run(self):
+        """Run until no events are left"""
+        while self.step():
+            pass
+
+    def run_until(self, predicate: Callable[[], bool], timeout: float | None = None) -> bool:
+        deadline = None if timeout is None else self.__now + timeout
+        while not predicate():
+            if deadline is not None and (not len(self.__events) or self.__events[0][0] > deadline):
+                self.__now = max(self.__now, deadline)
+                return predicate()
+            if not self.step():
+                raise RuntimeError(f"Simulation deadlocked at t={self.__now}: waiting with no pending events")
+        return True
@@ -0,0 +1,94 @@
+"""
+Topologies decide which processes are directly linked and how to forward to processes that are not. They compute
+neighbors and next hops from pid positions instead of storing adjacency, so a topology over N processes costs O(N)
+memory no matter how many links end up being used. Every process is considered its own neighbor (loopback)
+"""
+from __future__ import annotations
+from abc import abstractmethod
+
+
+class Topology:
+    def __init__(self, pids: list[str]):
+        self._pids = pids
+        self._index = {pids[i]: i for i in range(len(pids))}
+
+    def get_pids(self) -> list[str]:
+        """All pids in the topology. Shared between every router using it, do not mutate"""
+        return self._pids
+
+    @abstractmethod
+    def is_neighbor(self, pid: str, other_pid: str) -> bool:
+        """Whether pid has a direct link to other_pid"""
+
+    @abstractmethod
+    def next_hop(self, src_pid: str, dst_pid: str) -> str:
+        """Neighbor of src_pid to forward a message addressed to dst_pid through"""
+
+
+class FullMeshTopology(Topology):
+    """Every process linked to every other process"""
+    def is_neighbor(self, pid: str, other_pid: str) -> bool:
+        return True
+
+    def next_hop(self, src_pid: str, dst_pid: str) -> str:
+        return dst_pid
+
+
+class StarTopology(Topology):
+    """Every process linked only to the center process (e.g. the leader), which relays everything else"""
+    def __init__(self, pids: list[str], center_pid: str):
+        super().__init__(pids)
+        self.__center_pid = center_pid
+
+    def is_neighbor(self, pid: str, other_pid: str) -> bool:
+        return pid == other_pid or pid == self.__center_pid or other_pid == self.__center_pid
+
+    def next_hop(self, src_pid: str, dst_pid: str) -> str:
+        return dst_pid if self.is_neighbor(src_pid, dst_pid) else self.__center_pid
+
+
+class RingTopology(Topology):
+    """Every process linked to its predecessor and successor in pid order, forwarding takes the shorter direction"""
+    def is_neighbor(self, pid: str, other_pid: str) -> bool:
+        d = (self._index[other_pid] - self._index[pid]) % len(self._pids)
+        return d in (0, 1, len(self._pids) - 1)
+
+    def next_hop(self, src_pid: str, dst_pid: str) -> str:
+        n = len(self._pids)
+        i = self._index[src_pid]
+        d = (self._index[dst_pid] - i) % n
+        if d == 0:
+            return dst_pid
+        return self._pids[(i + 1) % n] if d <= n // 2 else self._pids[(i - 1) % n]
+
+
+class KAryTreeTopology(Topology):
+    """
+    Processes laid out as a complete k-ary tree in pid order (pids[0] is the root, the children of pids[i] are
+    pids[k*i + 1] to pids[k*i + k]). Every process is linked to its parent and children
+    """
+    def __init__(self, pids: list[str], k: int):
+        super().__init__(pids)
+        assert k >= 1
+        self.__k = k
+
+    def __parent(self, i: int) -> int:
+        return (i - 1) // self.__k
+
+    def is_neighbor(self, pid: str, other_pid: str) -> bool:
+        i, j = self._index[pid], self._index[other_pid]
+        return i == j or (i > 0 and self.__parent(i) == j) or (j > 0 and self.__parent(j) == i)
+
+    def next_hop(self, src_pid: str, dst_pid: str) -> str:
+        i = self._index[src_pid]
+        j = self._index[dst_pid]
+        if i == j:
+            return dst_pid
+
+        # Walk up from dst, if we pass through src then forward down to the child we came from, otherwise go up
+        while j > i:
+            parent = self.__parent(j)
+            if parent == i:
+                return self._pids[j]
+            j = parent
+        return self._pids[self.__parent(i)]
@@ -1,13 +1,18 @@
-from embeddings import GloveEmbedding
+from util.embedding_store import EmbeddingStore, convert_glove_txt
 import numpy as np
+import os
 
 def normalized(vec):
     return vec / np.linalg.norm(vec)
 
-g = GloveEmbedding('common_crawl_840', d_emb=300, show_progress=True)
+# One-time conversion of the GloVe release into a memory-mapped store, afterwards opening it is near-instant
+STORE_PATH = "./embeddings/common_crawl_840"
+if not os.path.exists(STORE_PATH):
+    convert_glove_txt("./embeddings/glove.840B.300d.txt", STORE_PATH, 300)
+g = EmbeddingStore(STORE_PATH)
 
-emb_queen_der = np.array(g.emb("husband")) - np.array(g.emb("man")) + np.array(g.emb("woman"))
-emb_queen = np.array(g.emb("wife"))
+(emb_husband, emb_man, emb_woman, emb_queen), _ = g.embs(["husband", "man", "woman", "wife"])
+emb_queen_der = emb_husband - emb_man + emb_woman
 #
 # # Similarity of the above two
 print(np.dot(normalized(emb_queen_der), normalized(emb_queen)))
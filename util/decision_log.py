@@ -0,0 +1,148 @@
+"""
+Durable append-only decision log. Each record is framed as [payload length: u32][crc32 of payload: u32][pickled
+payload]. Appends from any number of threads are grouped: a background flusher fsyncs everything written so far in
+one go, waiting at most durability_window seconds to gather more, and every append blocks until the fsync covering
+it completes. Opening a log replays its intact records and truncates a torn or corrupt tail left by a crash.
+
+durability_window controls the trade-off:
+    None - never fsync, records are only flushed to the OS (survive a process crash, not a power loss)
+    0    - fsync inline on every append (no grouping)
+    > 0  - group commit, when several appends are pending they wait up to this long (plus the fsync) to share an fsync
+
+One log may be shared by any number of processes and decisions. Processes write records as dicts carrying the
+"decision_id" and "pid" they belong to, and on restart only recover the records matching both (see find_recovered)
+"""
+from __future__ import annotations
+from threading import Thread, Lock, Condition
+from typing import Any
+import os
+import pickle
+import struct
+import time
+import zlib
+
+HEADER = struct.Struct("<II")
+
+
+def read_log(path: str) -> tuple[list[Any], int]:
+    """Intact records of the log at path and the byte offset where they end (anything after that is torn/corrupt)"""
+    records = []
+    end = 0
+    if not os.path.exists(path):
+        return records, end
+    with open(path, "rb") as f:
+        data = f.read()
+    while end + HEADER.size <= len(data):
+        length, crc = HEADER.unpack_from(data, end)
+        start = end + HEADER.size
+        payload = data[start:start + length]
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            break
+        records.append(pickle.loads(payload))
+        end = start + length
+    return records, end
+
+
+class DecisionLog:
+    def __init__(self, path: str, durability_window: float | None = 0.002, max_batch: int = 4096):
+        self.__path = path
+        self.__durability_window = durability_window
+        self.__max_batch = max_batch
+
+        # Recover, dropping whatever a crash left half-written after the last intact record
+        self.__recovered, end = read_log(path)
+        if os.path.exists(path) and os.path.getsize(path) > end:
+            os.truncate(path, end)
+        self.__file = open(path, "ab")
+
+        self.__lock = Lock()
+        self.__cond = Condition(self.__lock)
+        self.__written_seq = 0
+        self.__durable_seq = 0
+        self.__fsyncs = 0
+        self.__closed = False
+
+        self.__flusher = None
+        if durability_window is not None and durability_window > 0:
+            self.__flusher = Thread(target=self.__flush_loop, daemon=True)
+            self.__flusher.start()
+
+    def __sync(self):
+        self.__file.flush()
+        os.fsync(self.__file.fileno())
+        self.__fsyncs += 1
+
+    def __flush_loop(self):
+        self.__lock.acquire()
+        while True:
+            self.__cond.wait_for(lambda: self.__written_seq > self.__durable_seq or self.__closed)
+            if self.__written_seq == self.__durable_seq and self.__closed:
+                break
+
+            # If others are already committing concurrently, give them up to the durability window to join this batch.
+            # A lone committer is synced right away rather than waiting for siblings that may never come
+            deadline = time.monotonic() + self.__durability_window
+            while not self.__closed and 1 < self.__written_seq - self.__durable_seq < self.__max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.__cond.wait(remaining)
+
+            # Everything up to batch_seq is handed to the OS under the lock, the fsync itself runs without it so new
+            # appends can keep writing the next batch meanwhile
+            batch_seq = self.__written_seq
+            self.__file.flush()
+            self.__lock.release()
+            os.fsync(self.__file.fileno())
+            self.__lock.acquire()
+            self.__fsyncs += 1
+            self.__durable_seq = batch_seq
+            self.__cond.notify_all()
+        self.__lock.release()
+
+    def get_recovered(self) -> list[Any]:
+        """Records that were in the log when it was opened, oldest first"""
+        return self.__recovered
+
+    def find_recovered(self, decision_id: str, pid: str) -> dict | None:
+        """Latest recovered record written by pid for decision_id, None if it has none"""
+        for record in reversed(self.__recovered):
+            if isinstance(record, dict) and record.get("decision_id") == decision_id and record.get("pid") == pid:
+                return record
+        return None
+
+    def get_stats(self) -> dict[str, int]:
+        return {"appended": self.__written_seq, "durable": self.__durable_seq, "fsyncs": self.__fsyncs}
+
+    def append(self, record: Any):
+        """Append a record, returning once it is as durable as the durability window promises"""
+        payload = pickle.dumps(record)
+        frame = HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+        self.__lock.acquire()
+        if self.__closed:
+            self.__lock.release()
+            raise Exception("Decision log closed!!")
+        self.__file.write(frame)
+        self.__written_seq += 1
+        seq = self.__written_seq
+
+        if self.__durability_window is None:
+            self.__file.flush()
+            self.__durable_seq = seq
+        elif self.__flusher is None:
+            self.__sync()
+            self.__durable_seq = seq
+        else:
+            self.__cond.notify_all()
+            self.__cond.wait_for(lambda: self.__durable_seq >= seq)
+        self.__lock.release()
+
+    def close(self):
+        self.__lock.acquire()
+        self.__closed = True
+        self.__cond.notify_all()
+        self.__lock.release()
+        if self.__flusher is not None:
+            self.__flusher.join()
+        self.__file.close()
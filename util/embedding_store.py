@@ -0,0 +1,169 @@
+"""
+Memory-mapped word embedding store. A vocabulary is converted once into a flat float32 matrix plus an open-addressing
+hash index over the words, all written as raw arrays and opened with np.memmap. Opening a store costs only the
+memory maps, co-located processes share the same page cache pages, and batches of words are looked up with a single
+vectorized gather.
+
+Layout of a store directory:
+    meta.json    - {"size": number of words, "dim": embedding dimension, "table_size": hash table slots}
+    vectors.f32  - size x dim float32 matrix, row i is the embedding of word i
+    vocab.bin    - utf-8 encoded words, concatenated
+    offsets.i64  - size + 1 byte offsets of each word into vocab.bin
+    table.i64    - table_size slots holding a word index or -1, linear probing on a stable 64 bit hash of the word
+"""
+from __future__ import annotations
+from typing import Iterable, Sequence
+import hashlib
+import json
+import os
+import re
+import numpy as np
+
+META_FILE = "meta.json"
+VECTORS_FILE = "vectors.f32"
+VOCAB_FILE = "vocab.bin"
+OFFSETS_FILE = "offsets.i64"
+TABLE_FILE = "table.i64"
+
+
+def _word_hash(word: bytes) -> int:
+    # Python's hash() is salted per interpreter, the index needs a hash that is identical in every process
+    return int.from_bytes(hashlib.blake2b(word, digest_size=8).digest(), "little")
+
+
+class EmbeddingStore:
+    def __init__(self, path: str):
+        with open(os.path.join(path, META_FILE), "r") as f:
+            meta = json.load(f)
+        self.__size = meta["size"]
+        self.__dim = meta["dim"]
+        if self.__size == 0:
+            raise ValueError(f"Embedding store at {path} has an empty vocabulary")
+
+        self.__vectors = np.memmap(os.path.join(path, VECTORS_FILE), dtype=np.float32, mode="r", shape=(self.__size, self.__dim))
+        self.__vocab = np.memmap(os.path.join(path, VOCAB_FILE), dtype=np.uint8, mode="r")
+        self.__offsets = np.memmap(os.path.join(path, OFFSETS_FILE), dtype=np.int64, mode="r")
+        self.__table = np.memmap(os.path.join(path, TABLE_FILE), dtype=np.int64, mode="r")
+        self.__mask = meta["table_size"] - 1
+
+    def __len__(self) -> int:
+        return self.__size
+
+    def __contains__(self, word: str) -> bool:
+        return self.index(word) >= 0
+
+    def get_dim(self) -> int:
+        return self.__dim
+
+    def get_vectors(self) -> np.ndarray:
+        """The full read-only size x dim matrix"""
+        return self.__vectors
+
+    def word(self, index: int) -> str:
+        return self.__vocab[self.__offsets[index]:self.__offsets[index + 1]].tobytes().decode("utf-8")
+
+    def index(self, word: str) -> int:
+        """Row of word in the matrix, or -1 if it is not in the vocabulary"""
+        key = word.encode("utf-8")
+        slot = _word_hash(key) & self.__mask
+        while True:
+            i = int(self.__table[slot])
+            if i < 0:
+                return -1
+            if self.__vocab[self.__offsets[i]:self.__offsets[i + 1]].tobytes() == key:
+                return i
+            slot = (slot + 1) & self.__mask
+
+    def indices(self, words: Sequence[str]) -> np.ndarray:
+        return np.fromiter((self.index(w) for w in words), dtype=np.int64, count=len(words))
+
+    def emb(self, word: str) -> np.ndarray | None:
+        """Embedding of a single word (a copy), or None if it is not in the vocabulary"""
+        i = self.index(word)
+        return None if i < 0 else np.array(self.__vectors[i])
+
+    def embs(self, words: Sequence[str]) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Embeddings of a batch of words gathered in one go, as a len(words) x dim matrix with zero rows for words not in
+        the vocabulary, and a boolean mask of which words were found
+        """
+        idx = self.indices(words)
+        found = idx >= 0
+        out = np.zeros((len(words), self.__dim), dtype=np.float32)
+        out[found] = self.__vectors[idx[found]]
+        return out, found
+
+    def embed_texts(self, texts: Sequence[str]) -> np.ndarray:
+        """
+        Bag-of-words embedding of each text: the mean of its known lowercase word embeddings (zero if none are known).
+        All words of the batch are gathered at once
+        """
+        tokens = [re.findall(r"[\w']+", t.lower()) for t in texts]
+        counts = np.array([len(t) for t in tokens], dtype=np.int64)
+        vectors, found = self.embs([w for t in tokens for w in t])
+
+        out = np.zeros((len(texts), self.__dim), dtype=np.float32)
+        nonempty = counts > 0
+        if nonempty.any():
+            starts = np.concatenate(([0], np.cumsum(counts)[:-1]))[nonempty]
+            out[nonempty] = np.add.reduceat(vectors, starts, axis=0)
+            known = np.add.reduceat(found.astype(np.float32), starts)
+            out[nonempty] /= np.maximum(known, 1)[:, None]
+        return out
+
+
+def write_embedding_store(items: Iterable[tuple[str, Sequence[float]]], path: str, dim: int) -> EmbeddingStore:
+    """
+    One-time conversion of (word, embedding) pairs into a store at path. Vectors are streamed to disk, only the
+    vocabulary is held in memory. Later duplicates of a word are skipped. Raises ValueError if items is empty
+    """
+    os.makedirs(path, exist_ok=True)
+
+    words: list[bytes] = []
+    seen = set()
+    with open(os.path.join(path, VECTORS_FILE), "wb") as vectors_file:
+        for word, vec in items:
+            key = word.encode("utf-8")
+            if key in seen:
+                continue
+            seen.add(key)
+            words.append(key)
+            vectors_file.write(np.asarray(vec, dtype=np.float32).reshape(dim).tobytes())
+    del seen
+    if not len(words):
+        raise ValueError(f"No words to write to the embedding store at {path}")
+
+    offsets = np.zeros(len(words) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(w) for w in words])
+    with open(os.path.join(path, VOCAB_FILE), "wb") as f:
+        f.write(b"".join(words))
+    offsets.tofile(os.path.join(path, OFFSETS_FILE))
+
+    # At most half full so probe sequences stay short
+    table_size = 1
+    while table_size < 2 * max(len(words), 1):
+        table_size *= 2
+    mask = table_size - 1
+    table = np.full(table_size, -1, dtype=np.int64)
+    for i in range(len(words)):
+        slot = _word_hash(words[i]) & mask
+        while table[slot] >= 0:
+            slot = (slot + 1) & mask
+        table[slot] = i
+    table.tofile(os.path.join(path, TABLE_FILE))
+
+    with open(os.path.join(path, META_FILE), "w") as f:
+        json.dump({"size": len(words), "dim": dim, "table_size": table_size}, f)
+
+    return EmbeddingStore(path)
+
+
+def convert_glove_txt(txt_path: str, path: str, dim: int) -> EmbeddingStore:
+    """Convert a GloVe text release (one 'word v1 ... v_dim' per line, e.g. glove.840B.300d.txt) into a store at path"""
+    def items():
+        with open(txt_path, "r", encoding="utf-8") as f:
+            for line in f:
+                parts = line.rstrip("\n").rstrip(" ").split(" ")
+                # A few GloVe tokens contain spaces, the vector is always the last dim fields
+                yield " ".join(parts[:-dim]), np.array(parts[-dim:], dtype=np.float32)
+    return write_embedding_store(items(), path, dim)
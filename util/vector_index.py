@@ -0,0 +1,141 @@
+"""
+In-process embedding index. Vectors live L2-normalized in one contiguous float32 matrix, so a batch of queries is a
+single matrix product followed by a top-k partial sort. Supports metadata equality filters, incremental upserts and
+deletes, and saving to / loading from a directory. Meant for the few thousand choice/context vectors a process holds,
+not as a general vector database
+"""
+from __future__ import annotations
+from typing import Any, Sequence
+import json
+import os
+import numpy as np
+
+VECTORS_FILE = "vectors.npy"
+ENTRIES_FILE = "entries.json"
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+class EmbeddingIndex:
+    def __init__(self, dim: int, capacity: int = 1024):
+        self.__dim = dim
+        self.__vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self.__alive = np.zeros(capacity, dtype=bool)
+        self.__ids: list[str | None] = []
+        self.__metadatas: list[dict | None] = []
+        self.__id_to_row: dict[str, int] = dict()
+
+    def __len__(self) -> int:
+        return len(self.__id_to_row)
+
+    def __contains__(self, entry_id: str) -> bool:
+        return entry_id in self.__id_to_row
+
+    def get_dim(self) -> int:
+        return self.__dim
+
+    def get_metadata(self, entry_id: str) -> dict:
+        return self.__metadatas[self.__id_to_row[entry_id]]
+
+    def __grow(self, rows: int):
+        capacity = len(self.__vectors)
+        while capacity < rows:
+            capacity *= 2
+        if capacity != len(self.__vectors):
+            vectors = np.zeros((capacity, self.__dim), dtype=np.float32)
+            vectors[:len(self.__ids)] = self.__vectors[:len(self.__ids)]
+            alive = np.zeros(capacity, dtype=bool)
+            alive[:len(self.__ids)] = self.__alive[:len(self.__ids)]
+            self.__vectors, self.__alive = vectors, alive
+
+    def __compact(self):
+        """Drop deleted rows, keeping the surviving rows in their insertion order"""
+        rows = np.flatnonzero(self.__alive[:len(self.__ids)])
+        n = len(rows)
+        self.__vectors[:n] = self.__vectors[rows]
+        self.__alive[:] = False
+        self.__alive[:n] = True
+        self.__ids = [self.__ids[r] for r in rows]
+        self.__metadatas = [self.__metadatas[r] for r in rows]
+        self.__id_to_row = {self.__ids[i]: i for i in range(n)}
+
+    def add(self, ids: Sequence[str], vectors: np.ndarray, metadatas: Sequence[dict] | None = None):
+        """Insert vectors under the given ids, replacing the vector and metadata of ids already present"""
+        vectors = _normalize(np.asarray(vectors, dtype=np.float32).reshape(len(ids), self.__dim))
+        if metadatas is None:
+            metadatas = [dict() for _ in ids]
+
+        self.__grow(len(self.__ids) + len(ids))
+        for i in range(len(ids)):
+            row = self.__id_to_row.get(ids[i])
+            if row is None:
+                row = len(self.__ids)
+                self.__ids.append(ids[i])
+                self.__metadatas.append(None)
+                self.__id_to_row[ids[i]] = row
+            self.__vectors[row] = vectors[i]
+            self.__alive[row] = True
+            self.__metadatas[row] = metadatas[i]
+
+    def delete(self, ids: Sequence[str]):
+        for entry_id in ids:
+            row = self.__id_to_row.pop(entry_id, None)
+            if row is not None:
+                self.__alive[row] = False
+                self.__ids[row] = None
+                self.__metadatas[row] = None
+        # Compact once more than half the rows are dead so searches don't keep scanning them
+        if len(self.__ids) > 2 * len(self.__id_to_row):
+            self.__compact()
+
+    def __filter_mask(self, where: dict[str, Any] | None) -> np.ndarray:
+        mask = self.__alive[:len(self.__ids)].copy()
+        if where:
+            for row in np.flatnonzero(mask):
+                md = self.__metadatas[row]
+                if any(md.get(key) != val for key, val in where.items()):
+                    mask[row] = False
+        return mask
+
+    def query(self, vectors: np.ndarray, k: int = 5, where: dict[str, Any] | None = None) -> list[list[tuple[str, float, dict]]]:
+        """
+        Top-k cosine similarity search for a batch of query vectors, restricted to entries whose metadata matches every
+        key/value in where. Returns one list of (id, score, metadata), best first, per query vector
+        """
+        queries = _normalize(np.asarray(vectors, dtype=np.float32).reshape(-1, self.__dim))
+        mask = self.__filter_mask(where)
+        candidates = np.flatnonzero(mask)
+        k = min(k, len(candidates))
+        if k == 0:
+            return [[] for _ in range(len(queries))]
+
+        scores = queries @ self.__vectors[candidates].T
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+
+        results = []
+        for q in range(len(queries)):
+            rows = candidates[top[q]]
+            results.append([(self.__ids[r], float(scores[q, c]), self.__metadatas[r]) for r, c in zip(rows, top[q])])
+        return results
+
+    def save(self, path: str):
+        self.__compact()
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, VECTORS_FILE), self.__vectors[:len(self.__ids)])
+        with open(os.path.join(path, ENTRIES_FILE), "w") as f:
+            json.dump({"dim": self.__dim, "ids": self.__ids, "metadatas": self.__metadatas}, f)
+
+    @staticmethod
+    def load(path: str) -> EmbeddingIndex:
+        with open(os.path.join(path, ENTRIES_FILE), "r") as f:
+            entries = json.load(f)
+        index = EmbeddingIndex(entries["dim"], max(len(entries["ids"]), 1))
+        if len(entries["ids"]):
+            index.add(entries["ids"], np.load(os.path.join(path, VECTORS_FILE)), entries["metadatas"])
+        return index
@@ -1,46 +1,176 @@
 import math
+import heapq
+import bisect
+import os
+import numpy as np
 import pygame
-from util.util import do_intervals_intersect
-pygame.init()
 
 
 class IntervalVisualizer:
     ZOOM_OUT_FACTOR = 0.91
     ZOOM_IN_FACTOR = 1.09
 
-    def __init__(self, intervals: list[tuple[float, float] | tuple[float, float, tuple[int, int, int]]]):
+    # Number of coverage buckets spanning the finite extent of all intervals at the finest level of detail
+    LOD_BASE_BUCKETS = 2 ** 16
+    # Layers with fewer intervals than this are always drawn exactly, so no coverage pyramid is built for them
+    LOD_MIN_LAYER_INTERVALS = 256
+    # A layer switches to its coverage pyramid once more than this many of its intervals are visible per pixel column
+    LOD_INTERVALS_PER_PIXEL = 0.5
+
+    def __init__(self, intervals: list[tuple[float, float] | tuple[float, float, tuple[int, int, int]]], level_of_detail: bool = True):
         self.__size = (800, 200)
         self.__screen = None
         self.__running = True
 
-        # Divides intervals into visual slots (so overlapping intervals are shown on different layers)
-        self.__binned_intervals = []
-        for v in intervals:
-            available = False
-            for ib in range(len(self.__binned_intervals)):
-                b = self.__binned_intervals[ib]
-                if all(not do_intervals_intersect(v1[0], v1[1], v[0], v[1]) for v1 in b):
-                    available = True
-                    self.__binned_intervals[ib].append(v)
-                    break
-            if not available:
+        # Divides intervals into visual slots (so overlapping intervals are shown on different layers). Intervals are
+        # swept by start point while a min-heap tracks the end of the last interval placed on each layer, so a new
+        # interval goes on whichever layer frees up earliest, or on a new layer if none has freed up yet
+        self.__binned_intervals: list[list[tuple]] = []
+        lane_ends: list[tuple[float, int]] = []
+        for v in sorted(intervals, key=lambda x: (x[0], x[1])):
+            if len(lane_ends) and lane_ends[0][0] <= v[0]:
+                ib = lane_ends[0][1]
+                heapq.heapreplace(lane_ends, (v[1], ib))
+            else:
+                ib = len(self.__binned_intervals)
                 self.__binned_intervals.append([])
-                self.__binned_intervals[-1].append(v)
+                heapq.heappush(lane_ends, (v[1], ib))
+            self.__binned_intervals[ib].append(v)
+
+        # Intervals within a layer never overlap and are appended in start order, so their end points are sorted too.
+        # Keeping the ends per layer lets each frame binary search for the first interval visible to the camera
+        self.__lane_starts = [[v[0] for v in b] for b in self.__binned_intervals]
+        self.__lane_ends = [[v[1] for v in b] for b in self.__binned_intervals]
 
         min_int = min(v[0] for v in intervals if abs(v[0]) < math.inf)
         max_int = max(v[1] for v in intervals if abs(v[1]) < math.inf)
         self.__camera = [min_int, max_int]
 
+        # Per layer coverage pyramids (None for layers drawn exactly), see __build_lod_pyramid
+        self.__lod_origin = min_int
+        self.__lod_bucket_width = max(max_int - min_int, 1e-9) / self.LOD_BASE_BUCKETS
+        self.__lod_pyramids: list[list[np.ndarray] | None] = [None] * len(self.__binned_intervals)
+        # Intervals of aggregated layers that are still drawn exactly, see __build_lod_pyramid
+        self.__lod_exact: list[list[tuple]] = [[] for _ in self.__binned_intervals]
+        if level_of_detail:
+            for ib in range(len(self.__binned_intervals)):
+                if len(self.__binned_intervals[ib]) >= self.LOD_MIN_LAYER_INTERVALS:
+                    self.__lod_pyramids[ib] = self.__build_lod_pyramid(ib)
+
+        # Only the font module is needed to render frames, the display is initialized once a window is opened in run
+        pygame.font.init()
         self.__font = pygame.font.SysFont("Arial", self.__size[1] // 15)
 
         self.__dragging = None
 
+    def __build_lod_pyramid(self, ib: int) -> list[np.ndarray]:
+        """
+        Rasterize the finite intervals of a layer into LOD_BASE_BUCKETS boolean coverage buckets, then repeatedly halve
+        the resolution (a bucket is covered if either of its children is) until a single bucket remains. Level k of the
+        pyramid has buckets 2^k times wider than the base level. Intervals with an infinite end or their own color (like
+        a highlighted solution) are kept aside and always drawn exactly
+        """
+        starts = np.array(self.__lane_starts[ib], dtype=np.float64)
+        ends = np.array(self.__lane_ends[ib], dtype=np.float64)
+        colored = np.array([len(v) > 2 for v in self.__binned_intervals[ib]], dtype=bool)
+        aggregated = np.isfinite(starts) & np.isfinite(ends) & ~colored
+        self.__lod_exact[ib] = [self.__binned_intervals[ib][i] for i in np.flatnonzero(~aggregated)]
+
+        first = np.floor((starts[aggregated] - self.__lod_origin) / self.__lod_bucket_width).astype(np.int64)
+        last = np.ceil((ends[aggregated] - self.__lod_origin) / self.__lod_bucket_width).astype(np.int64)
+        first = np.clip(first, 0, self.LOD_BASE_BUCKETS - 1)
+        last = np.clip(np.maximum(last, first + 1), 1, self.LOD_BASE_BUCKETS)
+
+        # Difference array, +1 where an interval starts covering buckets and -1 past its last covered bucket
+        diff = np.bincount(first, minlength=self.LOD_BASE_BUCKETS + 1) - np.bincount(last, minlength=self.LOD_BASE_BUCKETS + 1)
+        levels = [np.cumsum(diff[:-1]) > 0]
+        while len(levels[-1]) > 1:
+            levels.append(levels[-1].reshape(-1, 2).any(axis=1))
+        return levels
+
+    def __draw_interval(self, surface: pygame.Surface, v: tuple, ib: int, cam: list[float], pixels_per_unit: float):
+        v_proj = [max(v[0], cam[0]), min(v[1], cam[1])]
+        if len(v) > 2:
+            v_proj.append(v[2])
+
+        h = (self.__size[1] // 2) + 2
+        h += ib * 5
+        start = ((v_proj[0] - cam[0]) * pixels_per_unit, h)
+        end = ((v_proj[1] - cam[0]) * pixels_per_unit, h)
+
+        pygame.draw.line(surface, (255, 0, 0) if len(v_proj) == 2 else v_proj[2], start, end, 2)
+        if v_proj[0] == v[0]:
+            pygame.draw.circle(surface, (0, 0, 0), start, 3)
+        if v_proj[1] == v[1]:
+            pygame.draw.circle(surface, (0, 0, 0), end, 3)
+
+    def __draw_lod_layer(self, surface: pygame.Surface, ib: int, cam: list[float], pixels_per_unit: float):
+        """Draw one line per run of covered buckets at the coarsest pyramid level no wider than a pixel"""
+        pyramid = self.__lod_pyramids[ib]
+        units_per_pixel = 1 / pixels_per_unit
+        level = int(math.floor(math.log2(max(units_per_pixel / self.__lod_bucket_width, 1))))
+        level = min(level, len(pyramid) - 1)
+        bucket_width = self.__lod_bucket_width * (2 ** level)
+        coverage = pyramid[level]
+
+        lo = max(int(math.floor((cam[0] - self.__lod_origin) / bucket_width)), 0)
+        hi = min(int(math.ceil((cam[1] - self.__lod_origin) / bucket_width)), len(coverage))
+        if lo < hi:
+            edges = np.diff(np.concatenate(([0], coverage[lo:hi].view(np.int8), [0])))
+            run_starts = np.flatnonzero(edges == 1) + lo
+            run_ends = np.flatnonzero(edges == -1) + lo
+
+            h = (self.__size[1] // 2) + 2 + ib * 5
+            for b0, b1 in zip(run_starts.tolist(), run_ends.tolist()):
+                x0 = max(self.__lod_origin + b0 * bucket_width, cam[0])
+                x1 = min(self.__lod_origin + b1 * bucket_width, cam[1])
+                pygame.draw.line(surface, (255, 0, 0), ((x0 - cam[0]) * pixels_per_unit, h), ((x1 - cam[0]) * pixels_per_unit, h), 2)
+
+        for v in self.__lod_exact[ib]:
+            if v[0] < cam[1] and v[1] > cam[0]:
+                self.__draw_interval(surface, v, ib, cam, pixels_per_unit)
+
+    def __draw_frame(self, surface: pygame.Surface, cam: list[float]):
+        pixels_per_unit = self.__size[0] / (cam[1] - cam[0])
+
+        surface.fill((255, 255, 255))
+
+        pygame.draw.line(surface, (0, 0, 0), (0, self.__size[1] // 2), (self.__size[0], self.__size[1] // 2), 1)
+
+        txt_left_bound = self.__font.render(str(round(cam[0], 2)), False, (0, 0, 0))
+        txt_right_bound = self.__font.render(str(round(cam[1], 2)), False, (0, 0, 0))
+
+        surface.blit(txt_left_bound, txt_left_bound.get_rect(bottomleft=(0, (self.__size[1] // 2) - 5)))
+        surface.blit(txt_right_bound, txt_right_bound.get_rect(bottomright=(self.__size[0], (self.__size[1] // 2) - 5)))
+
+        for ib in range(len(self.__binned_intervals)):
+            lane = self.__binned_intervals[ib]
+            # First interval ending after the left camera edge, and first interval starting at or after the right one
+            lo = bisect.bisect_right(self.__lane_ends[ib], cam[0])
+            hi = bisect.bisect_left(self.__lane_starts[ib], cam[1])
+
+            # Zoomed out far enough that many intervals share each pixel, draw the aggregated coverage instead
+            if self.__lod_pyramids[ib] is not None and hi - lo > self.LOD_INTERVALS_PER_PIXEL * self.__size[0]:
+                self.__draw_lod_layer(surface, ib, cam, pixels_per_unit)
+                continue
+
+            for i in range(lo, hi):
+                self.__draw_interval(surface, lane[i], ib, cam, pixels_per_unit)
+
     def scale_camera_about_center(self, factor: float):
         diff = (self.__camera[1] - self.__camera[0]) / 2
         translate = self.__camera[0] + diff
         self.__camera = [((self.__camera[0] - translate) * factor) + translate, ((self.__camera[1] - translate) * factor) + translate]
 
+    def render_to_png(self, path: str, camera: tuple[float, float] | None = None):
+        """Render a single frame off-screen (no display needed) and save it to path. Defaults to the current camera"""
+        cam = list(camera) if camera is not None else self.__camera
+        surface = pygame.Surface(self.__size)
+        self.__draw_frame(surface, cam)
+        pygame.image.save(surface, path)
+
     def run(self):
+        pygame.init()
         self.__screen = pygame.display.set_mode(self.__size, pygame.DOUBLEBUF)
         while self.__running:
             pixels_per_unit = self.__size[0] / (self.__camera[1] - self.__camera[0])
@@ -50,8 +180,6 @@ class IntervalVisualizer:
                 drag_diff = (pygame.mouse.get_pos()[0] - self.__dragging) / pixels_per_unit
                 cam = [cam[0] - drag_diff, cam[1] - drag_diff]
 
-            self.__screen.fill((255, 255, 255))
-
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
                     self.__running = False
@@ -67,36 +195,29 @@ class IntervalVisualizer:
                         self.__dragging = None
                         self.__camera = cam
 
-            pygame.draw.line(self.__screen, (0, 0, 0), (0, self.__size[1] // 2), (self.__size[0], self.__size[1] // 2), 1)
+            self.__draw_frame(self.__screen, cam)
 
-            txt_left_bound = self.__font.render(str(round(cam[0], 2)), False, (0, 0, 0))
-            txt_right_bound = self.__font.render(str(round(cam[1], 2)), False, (0, 0, 0))
-
-            self.__screen.blit(txt_left_bound, txt_left_bound.get_rect(bottomleft=(0, (self.__size[1] // 2) - 5)))
-            self.__screen.blit(txt_right_bound, txt_right_bound.get_rect(bottomright=(self.__size[0], (self.__size[1] // 2) - 5)))
-
-            for ib in range(len(self.__binned_intervals)):
-                for i in range(len(self.__binned_intervals[ib])):
-                    v = self.__binned_intervals[ib][i]
-
-                    if do_intervals_intersect(v[0], v[1], *cam):
-                        v_proj = [max(v[0], cam[0]), min(v[1], cam[1])]
-                        if len(v) > 2:
-                            v_proj.append(v[2])
-
-                        h = (self.__size[1] // 2) + 2
-                        h += ib * 5
-                        start = ((v_proj[0] - cam[0]) * pixels_per_unit, h)
-                        end = ((v_proj[1] - cam[0]) * pixels_per_unit, h)
-
-                        pygame.draw.line(self.__screen, (255, 0, 0) if len(v_proj) == 2 else v_proj[2], start, end, 2)
-                        if v_proj[0] == v[0]:
-                            pygame.draw.circle(self.__screen, (0, 0, 0), start, 3)
-                        if v_proj[1] == v[1]:
-                            pygame.draw.circle(self.__screen, (0, 0, 0), end, 3)
+            pygame.display.update()
 
 
-            pygame.display.update()
+def render_intervals_to_png(interval_sets: list[list[tuple]], out_dir: str, camera: tuple[float, float] | None = None, level_of_detail: bool = True) -> list[str]:
+    """
+    Headless batch rendering, e.g. for a sweep of CSP results. Switches SDL to its dummy video driver so no display is
+    needed, renders one PNG per interval set into out_dir and returns the written paths
+    """
+    if os.environ.get("SDL_VIDEODRIVER") != "dummy":
+        os.environ["SDL_VIDEODRIVER"] = "dummy"
+        if pygame.display.get_init():
+            pygame.display.quit()
+    pygame.display.init()
+
+    os.makedirs(out_dir, exist_ok=True)
+    paths = []
+    for i in range(len(interval_sets)):
+        path = os.path.join(out_dir, f"intervals_{i:05d}.png")
+        IntervalVisualizer(interval_sets[i], level_of_detail).render_to_png(path, camera)
+        paths.append(path)
+    return paths
 
 
 if __name__ == "__main__":